@@ -16,7 +16,8 @@ interim_dir = root_dir / "data" / "interim"
 
 # === FILE PATHS ===
 log_file = processed_dir / "unmatched_species.csv"
-backbone_file = external_dir / "backbone" / "Taxon.tsv"
+# GBIF backbone compiled from Taxon.tsv by src/supply/gbif_backbone.py
+backbone_file = interim_dir / "backbone" / "backbone.parquet"
 authors_file = processed_dir / "authors_disambiguated_truncated.pkl"
 order_output_pickle = processed_dir / "supply_and_demand_order_level.pkl"
 order_output_tsv = processed_dir / "supply_and_demand_order_level.tsv"
@@ -90,8 +91,14 @@ def get_canonical_name(name, kingdom=None, dataframe_name=None):
 ## BACKBONE
 
 #backbone = pd.read_csv("../../data/external/backbone/Taxon.tsv", sep="\t", on_bad_lines='skip', low_memory=False)
-backbone = pd.read_csv(backbone_file, sep="\t", on_bad_lines='skip', low_memory=False)
-backbone = backbone[backbone["taxonRank"]=="species"]
+if not backbone_file.exists():
+    raise FileNotFoundError(f"{backbone_file} not found: run src/supply/gbif_backbone.py first")
+# only the species, and only the columns used here
+backbone = pd.read_parquet(backbone_file, columns=["canonicalName", "taxonRank", "taxonomicStatus",
+                                                   "kingdom", "phylum", "class", "order"],
+                           filters=[("taxonRank", "==", "species")])
+# the lineage is built from plain strings below
+backbone = backbone.astype({c: object for c in ["taxonRank", "taxonomicStatus", "kingdom", "phylum", "class", "order"]})
 
 # Check for trailing or leading spaces
 backbone["canonicalName"] = backbone["canonicalName"].str.strip()
@@ -0,0 +1,243 @@
+# PARTITIONED PARQUET STORE OF ARTICLES
+"""
+Columnar store of articles (OpenAlex works): a Parquet dataset partitioned by
+journal and publication year (journal=S123/year=2020/part-....parquet).
+
+- Writes only ever add files, so a harvest appends every batch as it is done.
+  Every row records when it was written (harvested_at). When a work is stored
+  more than once (e.g. updated in an incremental harvest), reading keeps the
+  latest version.
+- Reads load only the requested columns, and filters on the partitions (journal,
+  year) or on any column skip the files and row groups that cannot match, e.g.
+  read(columns=["id", "source_id"], filters=[("year", ">=", 2020)]).
+
+Nested values (dicts, lists, and columns mixing types, like `source_is_oa` with
+True/False/"unknown") are stored as JSON text and decoded on reading. Text
+columns are stored as strings and numeric columns as numbers. The fields of the
+works and their flattened columns (prep_articles) have a declared encoding
+(COLUMN_ENCODINGS). Any other column gets one from its first values that are not
+missing; a column that is still all missing is left out of the file (and read
+back as missing). A later batch that does not fit widens the encoding: bool to
+int64 to double, and numbers to JSON (files written before are cast on reading).
+The encoding of every column is recorded in _columns.json, so that all files
+share one schema.
+"""
+import json
+import math
+import shutil
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+# custom packages
+import prep_articles
+
+PARTITION_SCHEMA = pa.schema([("journal", pa.string()), ("year", pa.int32())])
+NATIVE_TYPES = {"bool": pa.bool_(), "int64": pa.int64(), "double": pa.float64()}
+WIDENING = ["bool", "int64", "double", "json"]  # each encoding can hold the values of those before it
+
+# text fields; all other fields of the works (nested, or booleans that may be missing) are JSON
+TEXT_FIELDS = {
+    "work": ["id", "display_name", "title", "publication_date"],
+    "location": ["landing_page_url", "pdf_url", "license", "license_id", "version"],
+    "source": ["id", "display_name", "issn_l", "issn", "host_organization", "host_organization_name", "type"],
+    "oa": ["oa_status", "oa_url"],
+}
+COLUMN_ENCODINGS = {
+    **{field: "string" if field in TEXT_FIELDS["work"] else "json" for field in prep_articles.WORK_FIELDS},
+    **{f"{prefix}_{field}": "string" if field in TEXT_FIELDS[prefix] else "json"
+       for prefix, fields in [("location", prep_articles.LOCATION_FIELDS), ("source", prep_articles.SOURCE_FIELDS),
+                              ("oa", prep_articles.OPEN_ACCESS_FIELDS)]
+       for field in fields},
+    "abstract_full_text": "string",
+    "matched_keyword": "string",
+    "species_subject": "json",
+}
+
+
+def is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def column_encoding(column):
+    """
+    How a column is stored: "bool", "int64" or "double" for numbers, "string" for text,
+    else "json"; None if all its values are missing.
+    """
+    if column.isna().all():
+        return None
+    if pd.api.types.is_bool_dtype(column):
+        return "bool"
+    if pd.api.types.is_integer_dtype(column):
+        return "int64"
+    if pd.api.types.is_float_dtype(column):
+        return "double"
+    values = [v for v in column if not is_missing(v)]
+    if all(isinstance(v, str) for v in values):
+        return "string"
+    if all(isinstance(v, bool) for v in values):
+        return "bool"
+    return "json"
+
+
+def widen(encoding, found):
+    """Encoding that holds the values stored as `encoding` (None: none yet) and the new ones (`found`)."""
+    if encoding is None:
+        return found
+    if found is None or found == encoding:
+        return encoding
+    if encoding == "string":
+        if found == "json":
+            raise ValueError("text column gets nested values; declare it as json in COLUMN_ENCODINGS")
+        return encoding  # numbers are written as text
+    if found == "string":
+        return "json"
+    return max(encoding, found, key=WIDENING.index)
+
+
+def encode_column(column, encoding):
+    """The column as a pyarrow array in its store encoding."""
+    if encoding in NATIVE_TYPES:
+        return pa.array(column, type=NATIVE_TYPES[encoding], from_pandas=True)
+    if encoding == "string":
+        values = [None if is_missing(v) else v if isinstance(v, str) else str(v) for v in column]
+    else:
+        values = [None if is_missing(v) else json.dumps(v, default=str) for v in column]
+    return pa.array(values, type=pa.string())
+
+
+def journal_ids(articles):
+    """Short OpenAlex source ID of every article (from source_id or primary_location), "unknown" without one."""
+    if "source_id" in articles.columns:
+        ids = articles["source_id"]
+    elif "primary_location" in articles.columns:
+        ids = [((location or {}).get("source") or {}).get("id") if isinstance(location, dict) else None
+               for location in articles["primary_location"]]
+    else:
+        ids = [None] * len(articles)
+    return [str(i).rsplit("/", 1)[-1] if isinstance(i, str) and i else "unknown" for i in ids]
+
+
+def publication_years(articles):
+    """Publication year of every article (0 if unknown)."""
+    if "publication_date" not in articles.columns:
+        return [0] * len(articles)
+    return [int(d[:4]) if isinstance(d, str) and d[:4].isdigit() else 0 for d in articles["publication_date"]]
+
+
+class ArticleStore:
+    """
+    Parquet dataset of articles, partitioned by journal and publication year.
+
+    Args:
+        directory (str or Path): Root folder of the dataset.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.columns_path = self.directory / "_columns.json"
+        self.encodings = {}
+        if self.columns_path.exists():
+            with open(self.columns_path, "r", encoding="utf-8") as f:
+                self.encodings = json.load(f)
+
+    def reset(self):
+        """Delete all stored articles."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.encodings = {}
+
+    def is_empty(self):
+        return not self.encodings
+
+    def append(self, articles):
+        """Add articles (a DataFrame) as new files; nothing already stored is changed."""
+        if articles.empty:
+            return
+        articles = articles.reset_index(drop=True)
+        harvested_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+        arrays, names = [], []
+        for name in articles.columns:
+            if name in ("journal", "year", "harvested_at"):
+                continue  # reserved for the store
+            try:
+                encoding = widen(self.encodings.get(name, COLUMN_ENCODINGS.get(name)), column_encoding(articles[name]))
+            except ValueError as e:
+                raise ValueError(f"Column {name}: {e}") from None
+            if encoding is None:
+                continue  # all missing so far: nothing to base the encoding on
+            self.encodings[name] = encoding
+            arrays.append(encode_column(articles[name], encoding))
+            names.append(name)
+        self.encodings.setdefault("harvested_at", "string")
+        arrays += [pa.array([harvested_at] * len(articles), type=pa.string()),
+                   pa.array(journal_ids(articles), type=pa.string()),
+                   pa.array(publication_years(articles), type=pa.int32())]
+        names += ["harvested_at", "journal", "year"]
+
+        ds.write_dataset(
+            pa.Table.from_arrays(arrays, names=names),
+            self.directory,
+            format="parquet",
+            partitioning=ds.partitioning(PARTITION_SCHEMA, flavor="hive"),
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+            max_partitions=1_000_000,
+        )
+        # written after the data, so the recorded columns always exist in the files
+        with open(self.columns_path, "w", encoding="utf-8") as f:
+            json.dump(self.encodings, f, indent=2)
+
+    def schema(self):
+        """Schema of the whole dataset: every column ever written, and the partition fields."""
+        fields = [pa.field(name, NATIVE_TYPES.get(encoding, pa.string()))
+                  for name, encoding in self.encodings.items()]
+        return pa.schema(fields + list(PARTITION_SCHEMA))
+
+    def read(self, columns=None, filters=None, latest=True):
+        """
+        Read articles.
+
+        Args:
+            columns (list of str): Columns to read (default: all stored columns, without
+                harvested_at and the partition fields journal and year).
+            filters: pyarrow dataset expression, or a list of (column, operator, value)
+                tuples as in pandas.read_parquet, e.g. [("journal", "=", "S123")].
+            latest (bool): Keep only the latest version of every work (by id).
+
+        Returns:
+            pd.DataFrame: The articles, with nested columns decoded.
+        """
+        if columns is None:
+            columns = [name for name in self.encodings if name != "harvested_at"]
+        columns = list(columns)
+        if self.is_empty():
+            return pd.DataFrame(columns=columns)
+
+        read_columns = columns.copy()
+        if latest:
+            read_columns += [c for c in ("id", "harvested_at") if c not in read_columns]
+        if filters is not None and not isinstance(filters, ds.Expression):
+            filters = pq.filters_to_expression(filters)
+
+        dataset = ds.dataset(self.directory, format="parquet", schema=self.schema(),
+                             partitioning=ds.partitioning(PARTITION_SCHEMA, flavor="hive"))
+        articles = dataset.to_table(columns=read_columns, filter=filters).to_pandas()
+
+        if latest and not articles.empty:
+            # the latest version of a work is decided over the whole store, so that an
+            # older version cannot pass a filter that the latest one fails
+            versions = dataset.to_table(columns=["id", "harvested_at"]).to_pandas()
+            newest = versions.groupby("id")["harvested_at"].max()
+            articles = articles[articles["harvested_at"].to_numpy() == newest.reindex(articles["id"]).to_numpy()]
+            articles = articles.drop_duplicates(subset="id", keep="last")
+        articles = articles[columns].reset_index(drop=True)
+
+        for name in columns:
+            if self.encodings.get(name) == "json":
+                articles[name] = [None if v is None else json.loads(v) for v in articles[name]]
+        return articles
@@ -0,0 +1,64 @@
+# BENCHMARK THE RECONSTRUCTION OF ABSTRACTS FROM INVERTED INDEXES
+# compares the former 50 000-slot implementation with prep_taxonomy.inverted_index_to_text,
+# on synthetic PLOS ONE-sized input
+import argparse
+import random
+import time
+
+import pandas as pd
+# custom packages
+import prep_taxonomy
+
+
+def legacy_inverted_index_to_text(aii):
+    """The former implementation: a 50 000-slot list per abstract."""
+    abstract = 50000 * [None,]
+    for word, indices in aii.items():
+        for i in indices:
+            abstract[i] = word
+    abstract = [j for j in abstract if j is not None]
+    return " ".join(abstract)
+
+
+def synthetic_inverted_indexes(n, words_per_abstract=250, vocabulary_size=50000, missing=0.1, seed=0):
+    """Inverted indexes of n random abstracts; a fraction `missing` has no abstract."""
+    rng = random.Random(seed)
+    vocabulary = [f"word{i}" for i in range(vocabulary_size)]
+    indexes = []
+    for _ in range(n):
+        if rng.random() < missing:
+            indexes.append(None)
+            continue
+        aii = {}
+        length = rng.randint(words_per_abstract // 2, words_per_abstract * 3 // 2)
+        # a few frequent words and a long tail, like real text
+        for position in range(length):
+            word = vocabulary[min(int(rng.paretovariate(1.1)) - 1, vocabulary_size - 1)]
+            aii.setdefault(word, []).append(position)
+        indexes.append(aii)
+    return pd.Series(indexes)
+
+
+def timed(label, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    print(f"{label:<45}{time.perf_counter() - start:8.2f} s")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark abstract reconstruction.")
+    parser.add_argument("-n", type=int, default=240000, help="number of abstracts (PLOS ONE: about 240 000)")
+    args = parser.parse_args()
+
+    indexes = timed(f"generating {args.n} inverted indexes", synthetic_inverted_indexes, args.n)
+
+    legacy = timed("former inverted_index_to_text (per abstract)",
+                   lambda s: s.map(lambda x: legacy_inverted_index_to_text(x) if isinstance(x, dict) else None),
+                   indexes)
+    current = timed("inverted_index_to_text (per abstract)",
+                    lambda s: s.map(lambda x: prep_taxonomy.inverted_index_to_text(x) if isinstance(x, dict) else None),
+                    indexes)
+
+    assert legacy.equals(current), "implementations disagree"
+    print("Both implementations return the same texts")
@@ -0,0 +1,93 @@
+# BENCHMARK FLATTENING THE NESTED RELEASE INFORMATION OF WORKS
+# compares the former row-by-row flatten_works with prep_articles.flatten_works, which follows
+# fixed lists of fields, on synthetic works (1 000 000 by default)
+import argparse
+import copy
+import random
+import time
+
+import pandas as pd
+# custom packages
+import prep_articles
+
+
+def legacy_flatten_works(df_input):
+    """The former implementation: row by row, column order from an example row."""
+    i = 0
+    example_row = None
+    while example_row is None:
+        row = df_input.iloc[i]
+        if row["primary_location"]["source"] != None:
+            if "is_oa" in row["primary_location"]["source"] \
+            and "is_in_doaj" in row["primary_location"]["source"]:
+                example_row = row
+                length_source = len(row["primary_location"]["source"])
+        else:
+            i += 1
+
+    new_cols = ["location_" + x for x in example_row["primary_location"].keys()] + \
+               ["source_" + x for x in example_row["primary_location"]["source"].keys()] + \
+               ["oa_" + x for x in example_row["open_access"].keys()]
+    new_rows = []
+
+    for article in df_input.itertuples():
+        l_location = list(article.primary_location.values())
+        if article.primary_location["source"] != None:
+            if article.primary_location["source"]["issn"] != None and len(article.primary_location["source"]["issn"]) != 1:
+                article.primary_location["source"]["issn"] = ','.join(article.primary_location["source"]["issn"])
+            l_source = list(article.primary_location["source"].values())
+            if "is_oa" not in article.primary_location["source"]:
+                l_source.insert(4, "unknown")
+            if "is_in_doaj" not in article.primary_location["source"]:
+                l_source.insert(5, "unknown")
+        else:
+            l_source = [None,] * length_source
+        l_oa = list(article.open_access.values())
+        new_rows.append(l_location + l_source + l_oa)
+
+    new_df = pd.DataFrame(new_rows, columns=new_cols)
+    return df_input.merge(new_df, left_index=True, right_index=True)
+
+
+def synthetic_works(n, seed=0):
+    """n works with the release information of OpenAlex; some without source, or without is_oa/is_in_doaj."""
+    rng = random.Random(seed)
+    works = []
+    for i in range(n):
+        source = None
+        if rng.random() > 0.05:
+            source = {field: f"{field}{rng.randint(0, 999)}" for field in prep_articles.SOURCE_FIELDS}
+            source["issn"] = [f"{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}" for _ in range(2)]
+            for field in ("is_oa", "is_in_doaj"):
+                if rng.random() < 0.1:
+                    del source[field]
+        location = {field: f"{field}{rng.randint(0, 999)}" for field in prep_articles.LOCATION_FIELDS}
+        location["source"] = source
+        open_access = {field: f"{field}{rng.randint(0, 999)}" for field in prep_articles.OPEN_ACCESS_FIELDS}
+        works.append({"id": f"https://openalex.org/W{i}", "primary_location": location, "open_access": open_access})
+    return pd.DataFrame(works)
+
+
+def timed(label, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    print(f"{label:<45}{time.perf_counter() - start:8.2f} s")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark flatten_works.")
+    parser.add_argument("-n", type=int, default=1000000, help="number of works")
+    args = parser.parse_args()
+
+    works = timed(f"generating {args.n} works", synthetic_works, args.n)
+    # the former implementation modifies the source dicts (ISSN lists)
+    legacy_input = works.copy()
+    legacy_input["primary_location"] = [copy.deepcopy(x) for x in works["primary_location"]]
+
+    legacy = timed("former flatten_works (row by row)", legacy_flatten_works, legacy_input)
+    current = timed("flatten_works (fixed fields)", prep_articles.flatten_works, works)
+
+    new_columns = [c for c in legacy.columns if c not in works.columns and c != "location_source"]
+    assert legacy[new_columns].equals(current[new_columns]), "implementations disagree"
+    print("Both implementations return the same columns")
@@ -0,0 +1,137 @@
+# BENCHMARK SCANNING ARTICLES FOR SPECIES NAMES
+# compares the former regex-and-set prep_taxonomy.parse_for_taxonomy with the name scanner
+# (name_scanner.py) on synthetic names and articles (2 000 000 names and 100 000 articles by default)
+# abstracts name a few species each, as taxonomic abstracts do: the former version expanded
+# abbreviations by going over all candidates again for every taxon found, which grows with
+# the square of the names in an abstract
+import argparse
+import random
+import re
+import time
+
+import pandas as pd
+# custom packages
+import prep_taxonomy
+
+
+def legacy_parse_for_taxonomy(articles, backbone):
+    """The former implementation: regex candidates checked against a set of all names."""
+    all_names = set(backbone["canonicalName"])
+    all_found_taxa = []
+
+    for article in articles[["id", "title", "abstract_full_text"]].itertuples():
+        found = False
+        taxa_list = []
+
+        if article.title:
+            candidates = re.findall("[A-Z][a-z]+ [a-z]+", article.title)
+            for candidate in candidates:
+                if candidate not in taxa_list and candidate in all_names:
+                    taxa_list.append(candidate); found = True
+
+        if found:
+            all_found_taxa.append(taxa_list)
+            for taxon in taxa_list:
+                candidates = re.findall(rf"{taxon[0]}\. [a-z]+", article.title)
+                for candidate in candidates:
+                    candidate = taxon.split()[0] + " " + candidate[3:]
+                    if candidate not in taxa_list and candidate in all_names:
+                        taxa_list.append(candidate)
+            continue
+
+        if article.abstract_full_text:
+            candidates = re.findall("[A-Z][a-z]+ [a-z]+", article.abstract_full_text)
+            for candidate in candidates:
+                if candidate not in taxa_list and candidate in all_names:
+                    taxa_list.append(candidate); found = True
+
+        if found:
+            for taxon in taxa_list:
+                candidates.extend(re.findall(rf"{taxon[0]}\. [a-z]+", article.abstract_full_text))
+                for candidate in candidates:
+                    candidate = taxon.split()[0] + " " + candidate[3:]
+                    if candidate not in taxa_list and candidate in all_names:
+                        taxa_list.append(candidate); found = True
+
+        all_found_taxa.append(taxa_list)
+
+    articles["species_subject"] = all_found_taxa
+    return articles
+
+
+def syllables(rng, n):
+    return "".join(rng.choice(["ra", "to", "mi", "ca", "lu", "ne", "po", "si", "da", "ve"]) for _ in range(n))
+
+
+def synthetic_backbone(n_names, seed=0):
+    """Canonical names: genera with binomials, a few trinomials and hyphenated epithets."""
+    rng = random.Random(seed)
+    genera = sorted({syllables(rng, 3).capitalize() for _ in range(n_names // 50)})
+    names = []
+    while len(names) < n_names:
+        genus = rng.choice(genera)
+        epithet = syllables(rng, rng.randint(2, 4))
+        if rng.random() < 0.02:
+            epithet += "-" + syllables(rng, 2)
+        names.append(f"{genus} {epithet}")
+        if rng.random() < 0.05:
+            names.append(f"{genus} {epithet} {syllables(rng, 3)}")
+    return pd.DataFrame({"canonicalName": names + genera})
+
+
+def synthetic_articles(n, names, seed=1):
+    """Titles and abstracts of common words, with names, abbreviations and capitalized sentence starts."""
+    rng = random.Random(seed)
+    words = ["the", "of", "species", "new", "genus", "and", "in", "from", "with", "study", "results",
+             "we", "describe", "were", "collected", "specimens", "morphology", "phylogeny"]
+    binomials = [name for name in names if name.count(" ") == 1]
+
+    def text(length, name_rate):
+        out = []
+        for _ in range(length):
+            r = rng.random()
+            if r < name_rate:
+                name = rng.choice(binomials)
+                out.append(name)
+                if rng.random() < 0.5:  # mention it again, abbreviated
+                    genus, epithet = name.split(" ")
+                    out.append(f"{genus[0]}. {epithet}")
+            elif r < 0.1:
+                out.append(rng.choice(words).capitalize())
+            else:
+                out.append(rng.choice(words))
+        return " ".join(out)
+
+    return pd.DataFrame({"id": [f"W{i}" for i in range(n)],
+                         "title": [text(12, 0.02) for _ in range(n)],
+                         "abstract_full_text": [text(200, 0.02) if rng.random() > 0.1 else None for _ in range(n)]})
+
+
+def timed(label, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    print(f"{label:<45}{time.perf_counter() - start:8.2f} s")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark species name scanning.")
+    parser.add_argument("--names", type=int, default=2000000, help="number of canonical names")
+    parser.add_argument("-n", type=int, default=100000, help="number of articles")
+    args = parser.parse_args()
+
+    backbone = timed(f"generating {args.names} names", synthetic_backbone, args.names)
+    articles = timed(f"generating {args.n} articles", synthetic_articles, args.n, backbone["canonicalName"])
+
+    legacy = timed("former parse_for_taxonomy (regex and set)", legacy_parse_for_taxonomy,
+                   articles.copy(), backbone)["species_subject"]
+    scanned = timed("parse_for_taxonomy (name scanner)", prep_taxonomy.parse_for_taxonomy,
+                    articles.copy(), backbone)["species_subject"]
+
+    # the scanner also finds trinomials, hyphenated epithets and names in titles the former
+    # version missed; the names "no longer found" come from its abbreviation loop, which wrote
+    # every "X. epithet" with the genus of every taxon found, whatever the initial
+    missed = sum(len(set(a) - set(b)) for a, b in zip(legacy, scanned))
+    extra = sum(len(set(b) - set(a)) for a, b in zip(legacy, scanned))
+    print(f"Names found: {sum(map(len, legacy))} before, {sum(map(len, scanned))} now "
+          f"({extra} more, {missed} no longer found)")
@@ -2,6 +2,8 @@ import pandas as pd
 import numpy as np
 import re
 from pathlib import Path
+# custom packages
+import gbif_backbone
 
 # === Setup paths ===
 this_dir = Path(__file__).resolve().parent
@@ -37,21 +39,9 @@ authors["strippedName"] = stripped_names
 # === Load GBIF backbone ===
 backbone_path = external_dir / "Taxon.tsv"
 print(f"[INFO] Loading GBIF backbone from: {backbone_path}")
-backbone = pd.read_csv(backbone_path, sep="\t", 
-                       dtype={'scientificNameAuthorship': 'str',
-                              'infraspecificEpithet': 'str',
-                              'canonicalName': 'str',
-                              'genericName': 'str',
-                              'specificEpithet': 'str',
-                              'namePublishedIn': 'str',
-                              'taxonomicStatus': 'str',
-                              'taxonRank': 'str',
-                              'taxonRemarks': 'str',
-                              'kingdom': 'str',
-                              'phylum': 'str',
-                              'family': 'str',
-                              'genus': 'str'},
-                       on_bad_lines='skip')
+# (compiled once into Parquet by gbif_backbone.py; only the columns used here are read)
+backbone = gbif_backbone.load_backbone(columns=["canonicalName", "taxonomicStatus", "kingdom", "order", "family"],
+                                       taxon_path=backbone_path)
 
 backbone = backbone[backbone["taxonomicStatus"] != "doubtful"]
 backbone = backbone[["canonicalName", "kingdom", "order", "family"]].dropna(subset=["canonicalName"]).drop_duplicates()
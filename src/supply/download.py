@@ -3,13 +3,28 @@ Utility functions for retrieving and filtering journal and publication data from
 OpenAlex and Wikidata (SPARQL endpoint). 
 
 Includes:
-- SPARQL query builder and execution for journals with taxonomic relevance.
+- SPARQL query builder and execution for journals with taxonomic relevance,
+  split into concurrent chunks or pages to stay clear of the WDQS timeout.
 - OpenAlex API integration for sources and works.
 - Country filtering from a config file.
-- Retry logic for robust API access.
+- A shared, pooled OpenAlex client with a token-bucket rate limit, Retry-After
+  handling and retry logic for robust API access.
+- Concurrent harvesting of many OpenAlex queries under a shared rate budget, and of
+  one large query in publication-date slices.
+- On-disk cache of raw responses, with a replay-only mode for offline re-runs.
+- Checkpoints that let interrupted harvests resume from the last saved cursor.
+- Field projection (select=) of works, with a count of the bytes transferred.
+- Batching of many journals into one OR filter, and splitting the results per journal.
+- Writing of works page by page to gzipped JSON-lines shards.
+- Offline reading of works from a local copy of the OpenAlex snapshot.
+- Filter predicates on works, sent to OpenAlex where it supports them.
 """
 
 import requests
+import hashlib
+import gzip
+import json
+import re
 import numpy as np
 import pandas as pd
 import pickle
@@ -18,7 +33,17 @@ from SPARQLWrapper import SPARQLWrapper, JSON
 import time
 import sys
 import os
+import calendar
+import queue
+import threading
+import multiprocessing
+from functools import partial
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from urllib.parse import urlsplit, parse_qsl, urlencode
 #sys.stdout.reconfigure(line_buffering=True)
 
 
@@ -78,17 +103,13 @@ WHERE {
 
 
 # GET RESULTS OF SPARQLE QUERY (code from WikiData's query service)
-def get_sparql_results(query, retries=3, delay=5):
+def sparql_bindings(query, retries=3, delay=5):
     """
-    Fetch results from the Wikidata SPARQL endpoint with error handling and retry logic.
-
-    Args:
-        query (str): SPARQL query string.
-        retries (int): Number of retry attempts for failed requests.
-        delay (int): Delay in seconds between retries.
+    Fetch the result bindings of one query from the Wikidata SPARQL endpoint,
+    with error handling, retry logic and the response cache.
 
     Returns:
-        pd.DataFrame: DataFrame containing the query results.
+        list of dict: The bindings, or None if every attempt failed.
     """
     endpoint_url = "https://query.wikidata.org/sparql"
     user_agent = "WDQS-example Python/%s.%s" % (sys.version_info[0], sys.version_info[1])
@@ -96,18 +117,122 @@ def get_sparql_results(query, retries=3, delay=5):
     sparql = SPARQLWrapper(endpoint_url, agent=user_agent)
     sparql.setQuery(query)
     sparql.setReturnFormat(JSON)
+
+    cache_key = "sparql:" + normalize_sparql_query(query)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return json.loads(cached)["results"]["bindings"]
     
     for attempt in range(retries):
         try:
             results = sparql.query().convert()
-            return pd.DataFrame.from_dict(results["results"]["bindings"])
+            response_cache.put(cache_key, json.dumps(results))
+            return results["results"]["bindings"]
         except Exception as e:
             print(f"Attempt {attempt + 1}/{retries} failed with error: {e}")
             if attempt < retries - 1:
                 time.sleep(delay)  # Wait before retrying
             else:
-                print("Max retries reached. Returning an empty DataFrame.")
-                return pd.DataFrame()
+                print("Max retries reached.")
+                return None
+
+
+def merge_bindings(binding_lists):
+    """Concatenate lists of bindings into a DataFrame, dropping bindings that occur more than once."""
+    seen = set()
+    merged = []
+    for bindings in binding_lists:
+        for binding in bindings or []:
+            key = json.dumps(binding, sort_keys=True)
+            if key not in seen:
+                seen.add(key)
+                merged.append(binding)
+    return pd.DataFrame.from_dict(merged)
+
+
+def get_sparql_results(query, retries=3, delay=5, page_size=None, key="item"):
+    """
+    Fetch results from the Wikidata SPARQL endpoint with error handling and retry logic.
+
+    Args:
+        query (str): SPARQL query string, ending with the closing brace of its WHERE clause.
+        retries (int): Number of retry attempts for failed requests.
+        delay (int): Delay in seconds between retries.
+        page_size (int): If given, the results are fetched in pages of at most this many
+            rows, so that no single request comes near the 60-second WDQS timeout. The
+            pages are key ranges of `key`: every page asks for the rows whose key comes
+            after the last complete key of the page before (FILTER(STR(?key) > ...),
+            ORDER BY STR(?key)). The rows of one key (e.g. a journal with several ISSNs)
+            are thus never split over two pages or left out at a page boundary.
+        key (str): Variable the pages are cut on.
+
+    Returns:
+        pd.DataFrame: DataFrame containing the query results.
+    """
+    if page_size is None:
+        bindings = sparql_bindings(query, retries=retries, delay=delay)
+        if bindings is None:
+            print("Returning an empty DataFrame.")
+            return pd.DataFrame()
+        return pd.DataFrame.from_dict(bindings)
+
+    where_end = query.rstrip().rfind("}")
+    pages = []
+    last = None
+    while True:
+        key_filter = f'FILTER(STR(?{key}) > "{last}")\n' if last is not None else ""
+        bindings = sparql_bindings(f"{query[:where_end]}{key_filter}}}\nORDER BY STR(?{key})\nLIMIT {page_size}",
+                                   retries=retries, delay=delay)
+        if bindings is None:
+            print("A page failed. Returning partial results.")
+            break
+        if len(bindings) < page_size:
+            pages.append(bindings)
+            break
+        # the rows of the last key may go on in the next page: fetch that key again there
+        keys = [binding[key]["value"] for binding in bindings]
+        complete = [k for k in keys if k != keys[-1]]
+        if not complete:
+            raise ValueError(f"More than {page_size} rows for ?{key} {keys[-1]}: use a larger page_size")
+        pages.append([binding for binding, k in zip(bindings, keys) if k != keys[-1]])
+        last = complete[-1]
+
+    return merge_bindings(pages)
+
+
+def get_sparql_results_for_subjects(subjects, chunk_size=4, workers=3, retries=3, delay=5):
+    """
+    Fetch the journals about any of `subjects` (see `build_sparql_query`), in chunks.
+
+    The subjects are split into chunks of `chunk_size`, whose queries run
+    concurrently. A chunk whose query keeps failing (e.g. on the WDQS timeout)
+    is split in two and tried again, down to single subjects. The bindings of all
+    chunks are merged without duplicates.
+
+    Args:
+        subjects (list of str): Wikidata Q-codes of the subjects.
+        chunk_size (int): Number of subjects per query.
+        workers (int): Number of queries run at the same time.
+        retries (int): Number of retry attempts for each query.
+        delay (int): Delay in seconds between retries.
+
+    Returns:
+        pd.DataFrame: DataFrame containing the merged query results.
+    """
+    def fetch(chunk):
+        bindings = sparql_bindings(build_sparql_query(chunk), retries=retries, delay=delay)
+        if bindings is not None:
+            return bindings
+        if len(chunk) == 1:
+            print(f"Query for subject {chunk[0]} failed. Its journals are missing.")
+            return []
+        print(f"Query for {len(chunk)} subjects failed. Splitting it in two.")
+        half = len(chunk) // 2
+        return fetch(chunk[:half]) + fetch(chunk[half:])
+
+    chunks = [subjects[i:i + chunk_size] for i in range(0, len(subjects), chunk_size)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return merge_bindings(executor.map(fetch, chunks))
 
 #############################################################################
 # GET ALL SOURCES (JOURNALS) FROM OPENALEX API WITH SPECIFIED REQUIREMENTS
@@ -126,23 +251,18 @@ def request_sources(filter_string, email, retries=3, delay=5):
     """
     query = "https://api.openalex.org/sources?per-page=200&filter="+filter_string+"&mailto="+email
     
-    session = requests.Session()
     all_results = []
 
     for attempt in range(retries):
         try:
             # First page
-            response = session.get(query + "&cursor=*")
-            response.raise_for_status()  # Raise HTTPError for bad responses
-            data = response.json()
+            data = get_cached_json(query + "&cursor=*", retries=1)
             all_results.extend(data["results"])
 
             # Pagination
             next_cursor = data["meta"].get("next_cursor")
             while next_cursor:
-                response = session.get(query + f"&cursor={next_cursor}")
-                response.raise_for_status()
-                data = response.json()
+                data = get_cached_json(query + f"&cursor={next_cursor}", retries=1)
                 all_results.extend(data["results"])
                 next_cursor = data["meta"].get("next_cursor")
 
@@ -182,42 +302,342 @@ included_countries_path = root_dir / "config" / "included_countries.txt"
 with open(included_countries_path, "r", encoding="utf-8") as file:
     countries = [line.strip() for line in file if line.strip()]
     countries = "|".join(countries)
-    
-    
 
-def make_request_with_retries(url, session=None, retries=3, backoff_factor=2):
+
+# CACHE RAW RESPONSES ON DISK
+def normalize_url(url):
+    """
+    Normalize an API URL into a cache key: query parameters are sorted and
+    parameters that do not change the response (mailto, api_key) are dropped.
+    """
+    parts = urlsplit(url)
+    params = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                    if k not in ("mailto", "api_key"))
+    return f"{parts.scheme}://{parts.netloc}{parts.path}?{urlencode(params, safe=':,|*')}"
+
+
+def normalize_sparql_query(query):
+    """Collapse all whitespace in a SPARQL query, so layout changes do not miss the cache."""
+    return re.sub(r"\s+", " ", query).strip()
+
+
+class ResponseCache:
+    """
+    Content-addressed store of raw API responses.
+
+    Every response is saved gzipped under the SHA-256 of its normalized request.
+    Entries older than `ttl_days` are refetched, and the oldest entries are
+    evicted once the cache grows beyond `max_size_gb`. In replay-only mode the
+    network is never used: expired entries are still served, and a request that
+    is not cached raises FileNotFoundError.
+    """
+
+    def __init__(self, directory, enabled=True, ttl_days=30, max_size_gb=20, replay_only=False):
+        self.directory = Path(directory)
+        self.enabled = enabled or replay_only
+        self.ttl = ttl_days * 86400 if ttl_days else None
+        self.max_bytes = max_size_gb * 1024**3 if max_size_gb else None
+        self.replay_only = replay_only
+        self.size = None  # total size on disk, computed on first write
+        self.lock = threading.Lock()
+
+    def path(self, key):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return self.directory / digest[:2] / f"{digest}.json.gz"
+
+    def get(self, key):
+        """Return the cached response text for `key`, or None if it is missing or expired."""
+        if not self.enabled:
+            return None
+        path = self.path(key)
+        try:
+            fresh = (self.replay_only or self.ttl is None
+                     or time.time() - path.stat().st_mtime < self.ttl)
+            if fresh:
+                with gzip.open(path, "rt", encoding="utf-8") as file:
+                    return file.read()
+        except (FileNotFoundError, EOFError, OSError):
+            pass
+        if self.replay_only:
+            raise FileNotFoundError(f"No cached response for {key} (replay-only mode)")
+        return None
+
+    def put(self, key, text):
+        """Store the response text for `key` and evict old entries if the cache is too big."""
+        if not self.enabled or self.replay_only:
+            return
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as file:
+            file.write(text)
+
+        if self.max_bytes is None:
+            os.replace(tmp_path, path)
+            return
+        with self.lock:
+            # a key that is written again replaces its old entry: count only the difference
+            try:
+                old_size = path.stat().st_size
+            except FileNotFoundError:
+                old_size = 0
+            os.replace(tmp_path, path)
+            if self.size is None:
+                self.size = sum(f.stat().st_size for f in self.directory.glob("*/*.json.gz"))
+            else:
+                self.size += path.stat().st_size - old_size
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """Delete the oldest entries until the cache is back under 90% of its size limit."""
+        entries = sorted(((f.stat().st_mtime, f.stat().st_size, f)
+                          for f in self.directory.glob("*/*.json.gz")), key=lambda e: e[0])
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, f in entries:
+            if self.size <= 0.9 * self.max_bytes:
+                break
+            try:
+                f.unlink()
+                self.size -= size
+            except FileNotFoundError:
+                pass
+
+
+def load_config_section(section):
+    """Return one section of config.json as a dict (empty if the file or section is missing)."""
+    config_path = root_dir / "config" / "config.json"
+    if not config_path.exists():
+        return {}
+    with open(config_path, "r", encoding="utf-8") as file:
+        return dict(json.load(file).get(section) or {})
+
+
+def load_cache_settings():
+    """Read the "cache" section of config.json; REPLAY_ONLY=1 in the environment forces replay-only mode."""
+    settings = load_config_section("cache")
+    if os.environ.get("REPLAY_ONLY") == "1":
+        settings["replay_only"] = True
+    return settings
+
+
+response_cache = ResponseCache(root_dir / "data" / "cache" / "responses", **load_cache_settings())
+
+
+# COUNT WHAT COMES OVER THE NETWORK
+transfer_stats = {"requests": 0, "bytes": 0}
+transfer_lock = threading.Lock()
+
+
+def count_transfer(text):
+    """Add one live response to `transfer_stats` (cached responses are not counted)."""
+    with transfer_lock:
+        transfer_stats["requests"] += 1
+        transfer_stats["bytes"] += len(text.encode("utf-8"))
+
+
+# SHARE ONE REQUEST BUDGET BETWEEN ALL OPENALEX REQUESTS
+class TokenBucket:
     """
-    Make a request with retries and exponential backoff.
+    Thread-safe token bucket allowing `rate` requests per second, in bursts of at most `capacity`.
+
+    One bucket is shared by every thread that talks to OpenAlex.
+    When OpenAlex throttles a request, `throttle` pauses all callers and halves the
+    rate; every successful request then raises it a little, back up to the maximum.
+    """
+
+    def __init__(self, rate=10, capacity=None):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token if one is available; otherwise return how long to wait for one."""
+        with self.lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            # no tokens are added while paused: after a pause, callers do not all burst at once
+            self.tokens = min(self.capacity, self.tokens + (now - max(self.last, self.paused_until)) * self.rate)
+            self.last = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        wait = self.reserve()
+        while wait > 0:
+            time.sleep(wait)
+            wait = self.reserve()
+
+    def throttle(self, seconds):
+        """Pause every caller for `seconds` and halve the rate."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+            self.tokens = 0.0
+
+    def recover(self):
+        """Raise the rate a little after a successful request."""
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 100)
+
+
+def retry_after_seconds(response):
+    """Seconds to wait according to a Retry-After header (in seconds or as a date), or None."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class OpenAlexClient:
+    """
+    HTTP client shared by every OpenAlex request: one keep-alive connection pool
+    with gzip transfer, one token bucket, and retries with exponential backoff.
+
+    Throttling responses (429, 503) do not use up retries: they pause the whole
+    harvester for the Retry-After time (or an increasing default) and slow it
+    down, until `max_throttle_wait` seconds of throttling have been spent on one request.
+    """
+
+    def __init__(self, requests_per_second=10, pool_size=10, backoff_factor=2,
+                 max_throttle_wait=900, timeout=60):
+        self.bucket = TokenBucket(requests_per_second)
+        self.backoff_factor = backoff_factor
+        self.max_throttle_wait = max_throttle_wait
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate",
+                                     "User-Agent": "Mapping-taxonomists (python-requests)"})
+
+    def get(self, url, retries=3):
+        """
+        GET `url` within the shared rate budget.
+
+        Returns:
+            requests.Response: The successful response.
+
+        Raises:
+            requests.exceptions.RequestException: If the last attempt failed.
+        """
+        attempt = 0
+        n_throttled = 0
+        throttled = 0.0
+        while True:
+            self.bucket.acquire()
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+                if response.status_code in (429, 503) and throttled < self.max_throttle_wait:
+                    wait = retry_after_seconds(response)
+                    if wait is None:
+                        wait = min(60, 2 ** n_throttled)
+                    n_throttled += 1
+                    print(f"OpenAlex is throttling requests ({response.status_code}): "
+                          f"pausing all requests for {wait:.0f} seconds")
+                    self.bucket.throttle(wait)
+                    throttled += wait
+                    continue
+                response.raise_for_status()  # Raise exception for HTTP errors
+                self.bucket.recover()
+                return response
+            except requests.exceptions.RequestException as e:
+                attempt += 1
+                print(f"Attempt {attempt} failed: {e}")
+                if attempt >= retries:
+                    raise
+                sleep_time = self.backoff_factor ** (attempt - 1)
+                print(f"Retrying in {sleep_time} seconds...")
+                time.sleep(sleep_time)
+
+
+openalex_client = None
+openalex_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Return the OpenAlex client shared by the whole process, created on first use
+    from the "harvest" section of config.json (requests_per_second, workers).
+    """
+    global openalex_client
+    with openalex_client_lock:
+        if openalex_client is None:
+            settings = load_config_section("harvest")
+            openalex_client = OpenAlexClient(
+                requests_per_second=settings.get("requests_per_second", 10),
+                pool_size=max(10, settings.get("workers", 1)))
+        return openalex_client
+
+
+def get_cached_json(url, retries=3):
+    """
+    GET a JSON document from OpenAlex, served from the response cache when possible;
+    a live response is counted in `transfer_stats` and cached.
+
+    Raises:
+        requests.exceptions.RequestException: If the live request fails.
+    """
+    key = normalize_url(url)
+    text = response_cache.get(key)
+    if text is None:
+        text = get_client().get(url, retries=retries).text
+        count_transfer(text)
+        response_cache.put(key, text)
+    return json.loads(text)
+
+
+def make_request_with_retries(url, retries=3):
+    """
+    Make a request with the shared OpenAlex client, with retries and exponential backoff.
 
     Args:
         url (str): URL for the API request.
-        session (requests.Session): Persistent session object.
         retries (int): Number of retry attempts.
-        backoff_factor (int): Factor for exponential backoff.
 
     Returns:
-        requests.Response: Response object from the request.
+        requests.Response: Response object from the request, or None if every attempt failed.
     """
-    if session is None:
-        session = requests.Session()
+    try:
+        return get_client().get(url, retries=retries)
+    except requests.exceptions.RequestException:
+        print("Max retries reached. Returning None.")
+        return None
 
-    for attempt in range(retries):
-        try:
-            response = session.get(url)
-            response.raise_for_status()  # Raise exception for HTTP errors
-            return response
-        except requests.exceptions.RequestException as e:
-            print(f"Attempt {attempt + 1} failed: {e}")
-            if attempt < retries - 1:
-                sleep_time = backoff_factor ** attempt
-                print(f"Retrying in {sleep_time} seconds...")
-                time.sleep(sleep_time)
-            else:
-                print("Max retries reached. Returning None.")
-                return None
 
-# RETRIEVE ALL RECENT ARTICLES WITH A FILTER
-def request_works(filter_string, email, from_date="2014-01-01", to_date=None, print_number=True):
+def request_json_with_retries(url, retries=3):
+    """
+    Return the JSON document at `url` (see `get_cached_json`), or None if every attempt failed.
+    """
+    try:
+        return get_cached_json(url, retries=retries)
+    except requests.exceptions.RequestException:
+        print("Max retries reached. Returning None.")
+        return None
+
+# BUILD THE QUERY FOR ALL RECENT ARTICLES WITH A FILTER
+def works_query(filter_string, email, from_date="2014-01-01", to_date=None, api_key=None, select=None):
+    """
+    Return the OpenAlex works query (without cursor) for articles with European authors.
+
+    An `api_key` is only needed for premium filters such as from_updated_date.
+    With `select` (a list of top-level fields) only those fields of every work are returned.
+    """
     base_query = (
         f"https://api.openalex.org/works?per-page=200&filter=authorships.countries:{countries},"
         f"{filter_string},from_publication_date:{from_date}"
@@ -226,22 +646,192 @@ def request_works(filter_string, email, from_date="2014-01-01", to_date=None, pr
         query = f"{base_query},to_publication_date:{to_date}&mailto={email}"
     else:
         query = f"{base_query}&mailto={email}"
+    if select:
+        query += "&select=" + ",".join(select)
+    if api_key:
+        query += f"&api_key={api_key}"
+    return query
 
-    first_query  = f"{query}&cursor=*"
-    
-    #print("First query: " + first_query)
 
-    session = requests.Session()
-    response = make_request_with_retries(first_query, session=session, retries=3)
-    if response is None:
-        print("Failed to fetch initial page. Returning empty DataFrame.")
-        return pd.DataFrame()
+# FILTER PREDICATES: APPLIED BY OPENALEX WHERE IT CAN, LOCALLY OTHERWISE
+# fields that the works filter of the OpenAlex API supports, with the form of their values
+# ("https://openalex.org/domains/1" is filtered as topics.domain.id:1)
+SERVER_FILTER_FIELDS = {"topics.id", "topics.domain.id", "topics.field.id", "topics.subfield.id",
+                        "primary_topic.id", "primary_topic.domain.id", "primary_topic.field.id",
+                        "primary_topic.subfield.id", "concepts.id"}
 
-    data = response.json()
-    publications_results = data.get("results", [])
-    next_cursor = data["meta"].get("next_cursor")
-    if print_number:
-        print(f"Number of publications for {filter_string}: {data['meta']['count']}")
+
+def openalex_short_id(value):
+    """Short form of an OpenAlex ID for filters: "https://openalex.org/C123" -> "C123", ".../domains/1" -> "1"."""
+    return str(value).rstrip("/").rsplit("/", 1)[-1]
+
+
+class WorkPredicate:
+    """
+    Condition on works: the (dotted) `field` has at least one of `values`, e.g.
+    WorkPredicate("topics.domain.id", ["https://openalex.org/domains/1"]).
+    Lists on the path are searched in full, so this also holds if any topic has the domain.
+    """
+
+    def __init__(self, field, values):
+        self.field = field
+        self.values = [values] if isinstance(values, str) else list(values)
+
+    def server_side(self, max_values=100):
+        """True if OpenAlex can apply this predicate (one OR filter holds at most 100 values)."""
+        return self.field in SERVER_FILTER_FIELDS and 0 < len(self.values) <= max_values
+
+    def filter_string(self):
+        """The predicate as an OpenAlex filter, e.g. "topics.domain.id:1"."""
+        return self.field + ":" + "|".join(openalex_short_id(v) for v in self.values)
+
+    def field_values(self, work):
+        """All values found at `field` in a work."""
+        found = [work]
+        for key in self.field.split("."):
+            nested = []
+            for item in found:
+                item = item.get(key) if isinstance(item, dict) else None
+                if isinstance(item, list):
+                    nested.extend(item)
+                elif item is not None:
+                    nested.append(item)
+            found = nested
+        return found
+
+    def matches(self, work):
+        wanted = {openalex_short_id(v) for v in self.values}
+        return any(openalex_short_id(v) in wanted for v in self.field_values(work))
+
+    def __repr__(self):
+        return f"WorkPredicate({self.field!r}, {self.values!r})"
+
+
+def push_down(filter_string, predicates):
+    """
+    Split predicates into those OpenAlex applies, added to the filter string, and the rest.
+
+    Returns:
+        tuple: (filter string with the server-side predicates, list of predicates to apply locally)
+    """
+    local = []
+    for predicate in predicates or []:
+        if predicate.server_side():
+            filter_string += "," + predicate.filter_string()
+        else:
+            local.append(predicate)
+    return filter_string, local
+
+
+def apply_predicates(works, predicates):
+    """The works (list of dicts) that satisfy all predicates."""
+    if not predicates:
+        return works
+    return [work for work in works if all(p.matches(work) for p in predicates)]
+
+
+# SAVE PROGRESS OF LONG HARVESTS
+class HarvestCheckpoint:
+    """
+    Pages of one works query saved on disk, together with the cursor to continue from.
+
+    Every query gets its own subdirectory of `directory`, named after its
+    normalized URL. A page is written before the state that counts it, so an
+    interrupted harvest never points at a page that is missing.
+    """
+
+    def __init__(self, directory, query):
+        self.key = normalize_url(query)
+        digest = hashlib.sha256(self.key.encode("utf-8")).hexdigest()[:16]
+        self.directory = Path(directory) / digest
+        self.state = {"query": self.key, "pages": 0, "next_cursor": "*", "done": False}
+
+        state_path = self.directory / "state.json"
+        if state_path.exists():
+            with open(state_path, "r", encoding="utf-8") as file:
+                state = json.load(file)
+            if state.get("query") == self.key:
+                self.state = state
+
+    def page_path(self, n):
+        return self.directory / f"page{n:05d}.json.gz"
+
+    def saved_pages(self):
+        """Yield the results of every page saved so far."""
+        for n in range(self.state["pages"]):
+            with gzip.open(self.page_path(n), "rt", encoding="utf-8") as file:
+                yield json.load(file)
+
+    def save_page(self, results, next_cursor):
+        """Write one page of results and move the saved cursor past it."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with gzip.open(self.page_path(self.state["pages"]), "wt", encoding="utf-8") as file:
+            json.dump(results, file)
+
+        self.state = {"query": self.key, "pages": self.state["pages"] + 1,
+                      "next_cursor": next_cursor, "done": not next_cursor}
+        tmp_path = self.directory / "state.json.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self.state, file)
+        os.replace(tmp_path, self.directory / "state.json")
+
+
+# QUERIES PAGED TO THE END, BY (filter string, from_date, to_date)
+# (a query that failed on the way yields only part of its works and is not in here)
+finished_queries = set()
+
+
+def query_finished(filter_string, from_date="2014-01-01", to_date=None):
+    """Whether `iter_work_pages` (or `iter_sliced_work_pages`) paged this query to the end in this run."""
+    return (filter_string, from_date, to_date) in finished_queries
+
+
+# PAGE THROUGH ALL RECENT ARTICLES WITH A FILTER
+def iter_work_pages(filter_string, email, from_date="2014-01-01", to_date=None, print_number=True,
+                    checkpoint_dir=None, api_key=None, select=None, predicates=None):
+    """
+    Yield the results of a works query page by page (200 works per page).
+
+    Args:
+        filter_string (str): Filter string for the OpenAlex API.
+        email (str): User's email for polite API requests.
+        from_date (str): Earliest publication date (YYYY-MM-DD).
+        to_date (str): Latest publication date (YYYY-MM-DD), or None.
+        print_number (bool): Print the number of works matching the query.
+        checkpoint_dir (str or Path): If given, every page is saved there as it
+            arrives. Pages saved by an earlier, interrupted run are yielded from
+            disk first and paging continues from the saved cursor; a query that
+            was finished before is not requested again. A query paged to the end
+            is added to `finished_queries`.
+        api_key (str): OpenAlex premium API key, or None.
+        select (list of str): Top-level fields to download, or None for complete works.
+        predicates (list of WorkPredicate): Conditions the works must meet. Those that
+            OpenAlex supports are added to the query, the others are checked on every page.
+            With `select`, the fields of local predicates must be selected.
+
+    Yields:
+        list of dict: The works on one page.
+    """
+    key = (filter_string, from_date, to_date)
+    filter_string, local_predicates = push_down(filter_string, predicates)
+    query = works_query(filter_string, email, from_date=from_date, to_date=to_date,
+                        api_key=api_key, select=select)
+    next_cursor = "*"
+    n_results = 0
+
+    checkpoint = HarvestCheckpoint(checkpoint_dir, query) if checkpoint_dir else None
+    if checkpoint is not None:
+        for page in checkpoint.saved_pages():
+            n_results += len(page)
+            yield apply_predicates(page, local_predicates)
+        if checkpoint.state["done"]:
+            finished_queries.add(key)
+            return
+        next_cursor = checkpoint.state["next_cursor"]
+        if checkpoint.state["pages"]:
+            print(f"Resuming {filter_string} after {n_results} saved publications")
+
+    #print("First query: " + query + "&cursor=*")
 
     seen_cursors = set()
     while next_cursor:
@@ -250,15 +840,455 @@ def request_works(filter_string, email, from_date="2014-01-01", to_date=None, pr
             break
         seen_cursors.add(next_cursor)
 
-        next_query = f"{query}&cursor={next_cursor}"
-        response = make_request_with_retries(next_query, session=session, retries=3)
-        if response is None:
-            print("Failed to fetch additional pages. Returning partial results.")
+        first_page = next_cursor == "*"
+        data = request_json_with_retries(f"{query}&cursor={next_cursor}", retries=3)
+        if data is None:
+            if first_page:
+                print("Failed to fetch initial page. Returning empty DataFrame.")
+            else:
+                print("Failed to fetch additional pages. Returning partial results.")
             break
 
-        data = response.json()
-        publications_results.extend(data.get("results", []))
+        results = data.get("results", [])
         next_cursor = data["meta"].get("next_cursor")
-        print(f"Total publications fetched so far: {len(publications_results)}")
+        n_results += len(results)
+        if first_page:
+            if print_number:
+                print(f"Number of publications for {filter_string}: {data['meta']['count']}")
+        else:
+            print(f"Total publications fetched so far: {n_results}")
+
+        if checkpoint is not None:
+            checkpoint.save_page(results, next_cursor)
+        if not next_cursor:
+            finished_queries.add(key)
+        yield apply_predicates(results, local_predicates)
+
+
+# RETRIEVE ALL RECENT ARTICLES WITH A FILTER
+def request_works(filter_string, email, from_date="2014-01-01", to_date=None, print_number=True,
+                  checkpoint_dir=None, api_key=None, select=None, predicates=None,
+                  workers=1, slice_size=10000):
+    """
+    Return all works of a query as a DataFrame. With `workers` > 1, a query of more than
+    `slice_size` works is split into publication-date slices that are paged concurrently
+    (see `iter_sliced_work_pages`).
+    """
+    if workers > 1:
+        pages = iter_sliced_work_pages(filter_string, email, from_date=from_date, to_date=to_date,
+                                       workers=workers, slice_size=slice_size,
+                                       checkpoint_dir=checkpoint_dir, api_key=api_key,
+                                       select=select, predicates=predicates)
+    else:
+        pages = iter_work_pages(filter_string, email, from_date=from_date, to_date=to_date,
+                                print_number=print_number, checkpoint_dir=checkpoint_dir,
+                                api_key=api_key, select=select, predicates=predicates)
+    publications_results = []
+    for page in pages:
+        publications_results.extend(page)
+
+    return pd.DataFrame.from_dict(publications_results)
+
+
+# PAGE ONE LARGE QUERY WITH SEVERAL CURSORS AT ONCE
+def date_slices(from_date, to_date, year_counts, slice_size=10000):
+    """
+    Split a publication-date window into slices of about `slice_size` works:
+    a slice per year, or per month for a year with more works than `slice_size`.
+    Years without works are left out.
+
+    Args:
+        from_date (str): Earliest publication date (YYYY-MM-DD).
+        to_date (str): Latest publication date (YYYY-MM-DD), or None.
+        year_counts (dict): Publication year -> number of works (from `count_works`).
+        slice_size (int): Most works wanted in one slice.
+
+    Returns:
+        list of (str, str): (from_date, to_date) of every slice, oldest first.
+    """
+    slices = []
+    year_counts = {int(year): count for year, count in year_counts.items() if count}
+    for year in sorted(year_counts):
+        if year_counts[year] > slice_size:
+            months = [(f"{year}-{m:02d}-01", f"{year}-{m:02d}-{calendar.monthrange(year, m)[1]:02d}")
+                      for m in range(1, 13)]
+        else:
+            months = [(f"{year}-01-01", f"{year}-12-31")]
+        for start, end in months:
+            start = max(start, from_date)
+            end = min(end, to_date) if to_date else end
+            if start <= end:
+                slices.append((start, end))
+    return slices
+
+
+def iter_sliced_work_pages(filter_string, email, from_date="2014-01-01", to_date=None,
+                           workers=4, slice_size=10000, queue_size=None, **kwargs):
+    """
+    Yield the pages of a works query like `iter_work_pages`, with up to `workers`
+    cursors in flight at once.
+
+    OpenAlex cursors are sequential, so one query has one request in flight. A
+    cheap probe (group_by=publication_year) counts the works per year, and the
+    window is cut into year or month slices of about `slice_size` works
+    (`date_slices`), each paged by its own cursor. All cursors share the rate budget
+    of the OpenAlex client. Pages are yielded as they arrive, in no particular order,
+    and a work is yielded only once. At most `queue_size` pages (default: twice
+    `workers`) wait to be consumed. The query is added to `finished_queries` when
+    every slice was paged to the end.
+
+    Args:
+        filter_string (str): Filter string for the OpenAlex API.
+        email (str): User's email for polite API requests.
+        from_date (str): Earliest publication date (YYYY-MM-DD).
+        to_date (str): Latest publication date (YYYY-MM-DD), or None.
+        workers (int): Number of slices paged at the same time.
+        slice_size (int): Works per slice wanted.
+        **kwargs: Passed on to `iter_work_pages` (checkpoint_dir, api_key, select, predicates).
+
+    Yields:
+        list of dict: The works on one page.
+    """
+    year_counts = count_works(filter_string, email, "publication_year", from_date=from_date,
+                              to_date=to_date, api_key=kwargs.get("api_key"),
+                              predicates=kwargs.get("predicates"))
+    total = sum(year_counts.values()) if year_counts else 0
+    if not year_counts or total <= slice_size or workers <= 1:
+        # a small query (or a failed probe) is paged with one cursor
+        yield from iter_work_pages(filter_string, email, from_date=from_date, to_date=to_date, **kwargs)
+        return
+
+    slices = date_slices(from_date, to_date, year_counts, slice_size)
+    print(f"Number of publications for {filter_string}: {total}, paged in {len(slices)} date slices")
+    pages = queue.Queue(queue_size or 2 * workers)
+    stop = threading.Event()
+    slice_done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def page_slice(start, end):
+        try:
+            for page in iter_work_pages(filter_string, email, from_date=start, to_date=end,
+                                        print_number=False, **kwargs):
+                if not put(page):
+                    return
+        except Exception as e:
+            put(e)
+        finally:
+            put(slice_done)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for start, end in slices:
+            executor.submit(page_slice, start, end)
+        seen = set()
+        n_done = 0
+        while n_done < len(slices):
+            item = pages.get()
+            if item is slice_done:
+                n_done += 1
+                continue
+            if isinstance(item, Exception):
+                raise item
+            # slices do not overlap, but a work may move between pages while a cursor pages
+            page = [work for work in item if work.get("id") not in seen]
+            seen.update(work.get("id") for work in page)
+            yield page
+        if all(query_finished(filter_string, start, end) for start, end in slices):
+            finished_queries.add((filter_string, from_date, to_date))
+    finally:
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+# COUNT WORKS WITHOUT DOWNLOADING THEM
+def count_works(filter_string, email, group_by, from_date="2014-01-01", to_date=None,
+                api_key=None, predicates=None):
+    """
+    Number of works that a works query would return per value of `group_by`
+    (e.g. "publication_year"), from a single request, without downloading any works.
+
+    Predicates that OpenAlex cannot apply are left out, so the counts may be higher
+    than the number of works that `iter_work_pages` yields.
+
+    Returns:
+        dict: Value (as OpenAlex gives it, e.g. "2020") -> number of works, or None if the request failed.
+    """
+    filter_string, _ = push_down(filter_string, predicates)
+    query = works_query(filter_string, email, from_date=from_date, to_date=to_date, api_key=api_key)
+    data = request_json_with_retries(f"{query}&group_by={group_by}")
+    if data is None:
+        return None
+    return {str(group["key"]): group["count"] for group in data.get("group_by", []) if group.get("key")}
+
+
+def count_works_by_source(filter_string, email, **kwargs):
+    """
+    Number of works per journal (meta.count of every source) that a works query would return.
+
+    Returns:
+        dict: Source ID (e.g. "S123") -> number of works, or None if the request failed.
+    """
+    counts = count_works(filter_string, email, "primary_location.source.id", **kwargs)
+    if counts is None:
+        return None
+    return {openalex_short_id(key): count for key, count in counts.items()}
+
+
+# WRITE WORKS TO DISK AS THEY ARRIVE
+class JsonlShardWriter:
+    """
+    Writer of pages of works as gzipped JSON lines, `shard_size` works per file
+    (prefix00000.jsonl.gz, prefix00001.jsonl.gz, ...). Numbering starts at
+    `first_shard`, to add shards to an existing directory.
+    """
+
+    def __init__(self, directory, prefix="works", shard_size=10000, first_shard=0):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.shard = first_shard
+        self.in_shard = 0
+        self.file = None
+
+    def __call__(self, page):
+        for work in page:
+            if self.file is None:
+                path = self.directory / f"{self.prefix}{self.shard:05d}.jsonl.gz"
+                self.file = gzip.open(path, "wt", encoding="utf-8")
+            self.file.write(json.dumps(work) + "\n")
+            self.in_shard += 1
+            if self.in_shard >= self.shard_size:
+                self.file.close()
+                self.file = None
+                self.shard += 1
+                self.in_shard = 0
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ESTIMATE WHAT FIELD PROJECTION SAVES
+def projection_ratio(filter_string, email, select, predicates=None, **kwargs):
+    """
+    Compare the size of one page of complete works with the same page projected on `select`.
+
+    The projected page is the first page of the query as `iter_work_pages` asks for it, so
+    for a query of the harvest it comes from the response cache; only the page of complete
+    works is downloaded (once, it is cached as well).
+
+    Args:
+        filter_string (str): Filter string of a query of the harvest.
+        email (str): User's email for polite API requests.
+        select (list of str): Top-level fields of the projection.
+        predicates (list of WorkPredicate): Predicates of the harvest, added to the query like there.
+        **kwargs: Passed on to `works_query` (from_date, to_date, api_key).
+
+    Returns:
+        float: Bytes of complete works per byte of projected works, or None if a request failed.
+    """
+    filter_string, _ = push_down(filter_string, predicates)
+    sizes = []
+    for fields in (select, None):
+        url = works_query(filter_string, email, select=fields, **kwargs) + "&cursor=*"
+        data = request_json_with_retries(url)
+        if data is None:
+            return None
+        sizes.append(len(json.dumps(data["results"])))
+    return sizes[1] / sizes[0] if sizes[0] else None
+
+
+def batch_source_ids(source_ids, max_ids=100, max_length=2000):
+    """
+    Split OpenAlex source IDs into groups that fit in one OR filter
+    (primary_location.source.id:S1|S2|...).
+
+    Args:
+        source_ids (list of str): Source IDs, e.g. "S123".
+        max_ids (int): Most IDs per group (OpenAlex accepts up to 100 values in one filter).
+        max_length (int): Most characters the IDs of one group may add to the URL.
+
+    Returns:
+        list of list of str: The groups, in the order of `source_ids`.
+    """
+    batches, batch, length = [], [], 0
+    for source_id in source_ids:
+        if batch and (len(batch) >= max_ids or length + len(source_id) + 1 > max_length):
+            batches.append(batch)
+            batch, length = [], 0
+        batch.append(source_id)
+        length += len(source_id) + 1
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def split_by_source(works, source_ids):
+    """
+    Split the works of a batched query back per journal.
+
+    Args:
+        works (pd.DataFrame): Works with a `primary_location` column.
+        source_ids (list of str): Source IDs of the batch, e.g. "S123".
+
+    Returns:
+        dict: Source ID -> pd.DataFrame of its works, in the order of `source_ids`.
+    """
+    if len(source_ids) == 1:
+        return {source_ids[0]: works}
+    if works.empty:
+        return {source_id: works for source_id in source_ids}
+
+    sources = works["primary_location"].map(
+        lambda location: ((location or {}).get("source") or {}).get("id", "").split("/")[-1])
+    return {source_id: works[sources == source_id].reset_index(drop=True)
+            for source_id in source_ids}
+
+
+# HARVEST MANY QUERIES AT ONCE
+def harvest_works(filter_strings, email, workers=8, **kwargs):
+    """
+    Run `request_works` for many filter strings concurrently.
+
+    Queries are paged by up to `workers` threads at once, all sharing the rate
+    budget of the OpenAlex client (see `get_client`). Results are yielded in the
+    order of `filter_strings`, so callers can batch and save them exactly as they
+    would in a sequential loop. At most twice as many queries as there are workers
+    are submitted ahead of the consumer.
+
+    Args:
+        filter_strings (iterable of str): Filter strings, e.g. "primary_location.source.id:S123".
+        email (str): User's email for polite API requests.
+        workers (int): Number of queries paged at the same time.
+        **kwargs: Passed on to `request_works` (from_date, to_date, ...).
+
+    Yields:
+        tuple: (filter_string, pd.DataFrame) for every query, in input order.
+    """
+    workers = max(1, int(workers))
+    executor = ThreadPoolExecutor(max_workers=workers)
+    queue = iter(filter_strings)
+    pending = deque()
+
+    def schedule():
+        for filter_string in queue:
+            pending.append((filter_string, executor.submit(request_works, filter_string, email, **kwargs)))
+            return
+
+    try:
+        for _ in range(2 * workers):
+            schedule()
+        while pending:
+            filter_string, future = pending.popleft()
+            result = future.result()
+            schedule()
+            yield filter_string, result
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+# READ WORKS FROM A LOCAL OPENALEX SNAPSHOT INSTEAD OF THE API
+def snapshot_partitions(snapshot_dir):
+    """
+    List the gzipped JSON-lines partitions of the works in an OpenAlex snapshot,
+    oldest updated_date first (snapshot_dir may be the snapshot root or its data/works folder).
+    """
+    snapshot_dir = Path(snapshot_dir)
+    works_dir = snapshot_dir / "data" / "works"
+    if works_dir.exists():
+        snapshot_dir = works_dir
+    return sorted(snapshot_dir.glob("**/*.gz"))
+
+
+def scan_snapshot_partition(path, source_ids, from_date="2014-01-01", to_date=None, select=None,
+                            predicates=None):
+    """
+    Return the works of one snapshot partition that match the API query of `request_works`:
+    published in one of `source_ids`, between `from_date` and `to_date`, with at least one
+    author from the included countries, and meeting all `predicates`.
+    """
+    included = set(countries.split("|"))
+    source_pattern = re.compile(r"https://openalex\.org/(S\d+)")
+    found = []
+
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        for line in file:
+            # cheap test on the raw line before parsing it
+            if not source_ids.intersection(source_pattern.findall(line)):
+                continue
+            work = json.loads(line)
+
+            source = ((work.get("primary_location") or {}).get("source") or {})
+            if source.get("id", "").split("/")[-1] not in source_ids:
+                continue
+            date = work.get("publication_date") or ""
+            if date < from_date or (to_date and date > to_date):
+                continue
+            if not any(country in included
+                       for authorship in work.get("authorships") or []
+                       for country in authorship.get("countries") or []):
+                continue
+            if predicates and not all(p.matches(work) for p in predicates):
+                continue
+
+            if select:
+                work = {field: work.get(field) for field in select}
+            found.append(work)
+    return found
+
+
+def iter_snapshot_works(snapshot_dir, source_ids, from_date="2014-01-01", to_date=None,
+                        workers=None, select=None, predicates=None):
+    """
+    Yield the works of the given journals from a local OpenAlex snapshot, partition by
+    partition, without network access.
+
+    Partitions are scanned in parallel by a pool of `workers` processes (default: all cores),
+    and their works are yielded in the order of the partitions (oldest updated_date first),
+    so a later version of a work comes after the earlier ones. At most twice as many
+    partitions as there are workers are scanned ahead of the consumer.
+
+    Args:
+        snapshot_dir (str or Path): Local copy of the snapshot.
+        source_ids (iterable of str): OpenAlex source IDs, e.g. "S123".
+        from_date (str): Earliest publication date (YYYY-MM-DD).
+        to_date (str): Latest publication date (YYYY-MM-DD), or None.
+        workers (int): Number of processes.
+        select (list of str): Top-level fields to keep, or None for complete works.
+        predicates (list of WorkPredicate): Conditions the works must meet.
+
+    Yields:
+        list of dict: The matching works of one partition.
+    """
+    partitions = snapshot_partitions(snapshot_dir)
+    print(f"Reading {len(partitions)} snapshot partitions from {snapshot_dir}")
+    scan = partial(scan_snapshot_partition, source_ids=set(source_ids),
+                   from_date=from_date, to_date=to_date, select=select, predicates=predicates)
+    workers = workers or multiprocessing.cpu_count()
 
-    return pd.DataFrame.from_dict(publications_results)
\ No newline at end of file
+    with multiprocessing.Pool(workers) as pool:
+        pending = deque()
+        for i, path in enumerate(partitions):
+            pending.append(pool.apply_async(scan, (path,)))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().get()
+            if (i + 1) % 100 == 0:
+                print(f"Scanned {i + 1 - len(pending)}/{len(partitions)} partitions")
+        while pending:
+            yield pending.popleft().get()
@@ -0,0 +1,137 @@
+# COMPILED GBIF TAXONOMIC BACKBONE
+"""
+The GBIF backbone (data/external/backbone/Taxon.tsv, several GB) compiled once
+into a Parquet file, data/interim/backbone/backbone.parquet, that every script
+reads in seconds instead of parsing the TSV again:
+
+- only the columns the pipeline uses: integer taxon IDs, canonicalName, rank,
+  status and the lineage, with kingdom, phylum, class, order, family and genus
+  as the last six columns (prep_taxonomy.species_to_tree relies on that order);
+- rank, status and the lineage are dictionary-encoded and read as pandas
+  categoricals, so millions of rows share a few thousand strings;
+- the file records the version of the backbone it was compiled from (the
+  pubDate of eml.xml, or the size and date of Taxon.tsv), and is compiled again
+  when the backbone changes;
+- another Taxon.tsv is compiled next to it (e.g. Taxon.parquet), never into the
+  shared file.
+
+Run this script to compile the backbone; load_backbone compiles it if needed.
+Scripts outside src/supply read the file directly with pandas.read_parquet.
+"""
+import re
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+root_dir = Path(__file__).resolve().parents[2]
+TAXON_PATH = root_dir / "data" / "external" / "backbone" / "Taxon.tsv"
+BACKBONE_PATH = root_dir / "data" / "interim" / "backbone" / "backbone.parquet"
+
+ID_COLUMNS = ["taxonID", "acceptedNameUsageID"]
+LINEAGE_COLUMNS = ["kingdom", "phylum", "class", "order", "family", "genus"]
+CATEGORY_COLUMNS = ["taxonRank", "taxonomicStatus"] + LINEAGE_COLUMNS
+COLUMNS = ID_COLUMNS + ["canonicalName"] + CATEGORY_COLUMNS
+
+SCHEMA = pa.schema([pa.field(c, pa.int64()) for c in ID_COLUMNS] +
+                   [pa.field("canonicalName", pa.string())] +
+                   [pa.field(c, pa.dictionary(pa.int32(), pa.string())) for c in CATEGORY_COLUMNS])
+
+
+def backbone_version(taxon_path=TAXON_PATH):
+    """Version of the backbone: the pubDate in eml.xml next to Taxon.tsv, else its size and modification time."""
+    taxon_path = Path(taxon_path)
+    eml_path = taxon_path.parent / "eml.xml"
+    if eml_path.exists():
+        match = re.search(r"<pubDate>\s*([^<]+?)\s*</pubDate>", eml_path.read_text(encoding="utf-8", errors="ignore"))
+        if match:
+            return match.group(1)
+    stat = taxon_path.stat()
+    return f"{stat.st_size}-{int(stat.st_mtime)}"
+
+
+def compiled_version(path=BACKBONE_PATH):
+    """Backbone version the compiled file was made from, or None if there is none."""
+    if not Path(path).exists():
+        return None
+    metadata = pq.read_schema(path).metadata or {}
+    return metadata.get(b"backbone_version", b"").decode() or None
+
+
+def compiled_path(taxon_path=TAXON_PATH):
+    """
+    Where the backbone of `taxon_path` is compiled: BACKBONE_PATH for the project backbone,
+    else a Parquet file next to the TSV (e.g. Taxon.parquet), so that another backbone
+    never overwrites the shared file.
+    """
+    taxon_path = Path(taxon_path)
+    if taxon_path.resolve() == TAXON_PATH.resolve():
+        return BACKBONE_PATH
+    return taxon_path.with_suffix(".parquet")
+
+
+def compile_backbone(taxon_path=TAXON_PATH, path=None, chunksize=1_000_000, force=False):
+    """
+    Compile Taxon.tsv into the Parquet backbone, unless it was compiled from the same version.
+    Without `path`, the backbone goes to compiled_path(taxon_path).
+
+    The TSV is read in chunks of `chunksize` rows (one row group each), so compiling
+    never holds the whole backbone in memory.
+
+    Returns:
+        Path: The compiled backbone.
+    """
+    taxon_path = Path(taxon_path)
+    path = compiled_path(taxon_path) if path is None else Path(path)
+    version = backbone_version(taxon_path)
+    if not force and compiled_version(path) == version:
+        return path
+
+    print(f"[INFO] Compiling GBIF backbone {version} from {taxon_path}")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".parquet.tmp")
+    schema = SCHEMA.with_metadata({"backbone_version": version})
+    n_rows = 0
+    with pq.ParquetWriter(tmp_path, schema) as writer:
+        for chunk in pd.read_csv(taxon_path, sep="\t", usecols=COLUMNS, dtype=str,
+                                 on_bad_lines="skip", chunksize=chunksize):
+            arrays = [pa.array(pd.to_numeric(chunk[c], errors="coerce").astype("Int64"), type=pa.int64())
+                      for c in ID_COLUMNS]
+            arrays.append(pa.array(chunk["canonicalName"], type=pa.string(), from_pandas=True))
+            arrays += [pa.array(chunk[c], type=pa.string(), from_pandas=True).dictionary_encode()
+                       .cast(pa.dictionary(pa.int32(), pa.string())) for c in CATEGORY_COLUMNS]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            n_rows += len(chunk)
+    tmp_path.replace(path)
+    print(f"[INFO] Compiled {n_rows} taxa into {path}")
+    return path
+
+
+def load_backbone(columns=None, filters=None, taxon_path=TAXON_PATH, path=None):
+    """
+    Read the compiled backbone, compiling it first if Taxon.tsv is newer or it does not exist
+    (at `path`, by default compiled_path(taxon_path)).
+
+    Args:
+        columns (list of str): Columns to read (default: all, in the order of COLUMNS).
+        filters: Row filters as in pandas.read_parquet, e.g. [("taxonRank", "=", "species")].
+            Row groups that cannot match are skipped.
+
+    Returns:
+        pd.DataFrame: The taxa, with integer IDs (Int64) and rank, status and lineage as categoricals.
+    """
+    taxon_path = Path(taxon_path)
+    path = compiled_path(taxon_path) if path is None else Path(path)
+    if taxon_path.exists():
+        compile_backbone(taxon_path, path)
+    elif not path.exists():
+        raise FileNotFoundError(f"GBIF backbone not found at {taxon_path}")
+    if columns is not None:
+        columns = sorted(columns, key=COLUMNS.index)  # kingdom ... genus stay last
+    table = pq.read_table(path, columns=columns, filters=filters, memory_map=True)
+    return table.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)  # IDs stay integers with gaps
+
+
+if __name__ == "__main__":
+    compile_backbone()
@@ -5,21 +5,18 @@ import os
 # custom packages
 import download
 import prep_articles
+import work_index
+import article_store
+import pipeline
 import json
 from datetime import datetime
 from pathlib import Path
 import sys
-import time
+import shutil
 
 def ts(msg):
     print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {msg}")
     
-ts("Entered get_articles.py")
-
-
-
-print("=== get_articles.py started ===")
-
 def validate_date(date_str):
     try:
         datetime.strptime(date_str, "%Y-%m-%d")
@@ -27,178 +24,344 @@ def validate_date(date_str):
     except ValueError:
         return False
 
-# === Path setup ===
-this_dir = Path(__file__).resolve().parent
-root_dir = this_dir.parents[1]  # Adjust if needed
 
-config_path = root_dir / "config" / "config.json"
+class JournalDone:
+    """Marker that follows the last page of a mega-journal through the harvest pipeline."""
 
-ts(f"Resolved config path: {config_path}")
+    def __init__(self, oaid):
+        self.oaid = oaid
 
-journals_path = root_dir / "data" / "processed" / "journals.csv"
-articles_dir = root_dir / "data" / "raw" / "articles"
-interim_dir = root_dir / "data" / "interim" / "keyword-filtered_articles"
-raw_dir = root_dir / "data" / "raw" / "articles"
 
-interim_dir.mkdir(parents=True, exist_ok=True)
+def main():
+    ts("Entered get_articles.py")
+    print("=== get_articles.py started ===")
 
-# === Load configuration ===
-if not config_path.exists():
-    raise FileNotFoundError(f"Config file not found at {config_path}")
+    # === Path setup ===
+    this_dir = Path(__file__).resolve().parent
+    root_dir = this_dir.parents[1]  # Adjust if needed
 
-ts("Loading config...")
+    config_path = root_dir / "config" / "config.json"
 
-with open(config_path, "r", encoding="utf-8") as config_file:
-    config = json.load(config_file)
-    
-ts("Config loaded")
-    
-# Extract dates
-from_date = config.get("from_date", "2014-01-01")  # Default to 2014-01-01 if not provided
-to_date = config.get("to_date", "2023-12-31")      # Default to 2023-12-31 if not provided
-
-if not validate_date(from_date) or not validate_date(to_date):
-    raise ValueError("Invalid date format in configuration. Use YYYY-MM-DD.")
-
-print("From ="+from_date+" To ="+to_date)
-      
-journals = pd.read_csv(journals_path)
-if journals is None:
-    raise ValueError("No journals were loaded — check input files or download step.")
-
-# clear directory
-articles_dir.mkdir(parents=True, exist_ok=True)
-files = glob.glob(str(articles_dir / "*"))
-#files.extend(glob.glob("../../data/interim/eu_keyword-filtered_articles/*"))
-for f in files:
-    os.remove(f)
-
-# ask OpenAlex (nicely) for all articles from these journals from 2014-2023
-# can only use journals that have OpenAlex IDs and that are not dissolved
-oaids = list(set(journals[journals["dissolved"]!=True]["openAlexID"]))
-#email = input("Enter e-mail address for OpenAlex API: ")
-email = config.get("email")
-
-if not email:
-    raise ValueError("Email address for OpenAlex API is missing in config.json")
-print("using email: "+email)
-
-articles = []
-n = 0; m = 0
-
-ts("About to request PLOS ONE articles")
-print("Requesting PLOS ONE articles from OpenAlex...")
-
-# deal with PLOS ONE now
-#plosone_articles = download.request_works("primary_location.source.id:S202381698", email, to_date="2023-12-31")
-
-plosone_articles = download.request_works(
-    "primary_location.source.id:S202381698",
-    email,
-    to_date="2023-12-31"
-)
-print(f"Retrieved {len(plosone_articles)} PLOS ONE articles")
-print(f"[DEBUG] Raw PLOS ONE articles returned: {len(plosone_articles)}")
-
-filtered_articles = prep_articles.filter_keywords(plosone_articles, config=config)
-
-print(f"[DEBUG] Articles after keyword filtering: {len(filtered_articles)}")
-
-if filtered_articles is None or filtered_articles.empty:
-    raise ValueError("No PLOS ONE articles were loaded — possibly none matched after filtering.")
-
-for i in range(10):
-    print(f"Still working... {i}")
-    time.sleep(5)
-    
-print(f"[DEBUG] Articles returned: {len(filtered_articles)}")
+    ts(f"Resolved config path: {config_path}")
 
-filtered_articles = prep_articles.filter_by_domain(filtered_articles, domain_id="https://openalex.org/domains/1")
+    journals_path = root_dir / "data" / "processed" / "journals.csv"
+    articles_dir = root_dir / "data" / "raw" / "articles"
+    interim_dir = root_dir / "data" / "interim" / "keyword-filtered_articles"
+    raw_dir = root_dir / "data" / "raw" / "articles"
 
-if filtered_articles.empty:
-    print("[WARNING] Filtered PLOS ONE articles are empty — nothing to save!")
-else:
-    save_path = interim_dir / f"articles{m}.pkl"
     interim_dir.mkdir(parents=True, exist_ok=True)
-    print(f"[DEBUG] Saving {len(filtered_articles)} filtered articles to {save_path}")
-    filtered_articles.to_pickle(save_path)
-    
-#filtered_articles.to_pickle("../../data/interim/keyword-filtered_articles/articles"+str(m)+".pkl")
-print(f"[DEBUG] Saving {len(filtered_articles)} articles to: {interim_dir / f'articles{m}.pkl'}")
-filtered_articles.to_pickle(interim_dir / f"articles{m}.pkl")
-#eu_articles = prep_articles.filter_eu_articles(filtered_articles)
-#eu_articles.to_pickle("../../data/interim/eu_keyword-filtered_articles/eu_articles"+str(m)+".pkl")
-m += 1
-
-# download recent articles from every taxonomic journal
-for oaid in oaids:
-    #print(f"Processing journal: {oaid}")
-    #for i in range(10):
-    #    print(f"Still working... {i}")
-    #    time.sleep(5)
-    if oaid != oaid: # check if nan
-        continue
-    if oaid == "S202381698": # dealt with PLOS ONE separately
-        continue # (returns ~240 000 articles)
-    
-    # search by confirmed OpenAlex ID (from OpenAlex itself or Wikidata) 
-    journal_articles = download.request_works("primary_location.source.id:"+oaid, email, 
-                                              from_date=from_date, to_date=to_date)
-    n += len(journal_articles)
-    articles.append(journal_articles)
-    
-    # split the dataframe every 10 000 articles
-    if n >= 10000:
-        print("Another "+str(n)+" articles found")
-        # save raw data
-        articles_df = pd.concat(articles, ignore_index=True)
-        #articles_df.to_pickle("../../data/raw/articles/articles"+str(m)+".pkl")
-        #articles_df.to_csv("../../data/raw/articles/articles"+str(m)+".tsv", sep="\t")
-        
-        # save (European) keyword-filtered articles
-        filtered_articles = prep_articles.filter_keywords(articles_df, config=config)
-        filtered_articles = prep_articles.filter_by_domain(filtered_articles, domain_id="https://openalex.org/domains/1")
-                
-        #filtered_articles.to_pickle("../../data/interim/keyword-filtered_articles/eu_articles"+str(m)+".pkl")
-        print(f"[DEBUG] Saving {len(filtered_articles)} articles to: {interim_dir / f'articles{m}.pkl'}")
-        filtered_articles.to_pickle(interim_dir / f"eu_articles{m}.pkl")
-        #filtered_articles.to_csv("../../data/interim/keyword-filtered_articles/eu_articles"+str(m)+".tsv", sep="\t")
-        #eu_articles.to_pickle("../../data/interim/eu_keyword-filtered_articles/eu_articles"+str(m)+".pkl")
-        
-        articles = []
-        n = 0; m += 1
-
-# same procedure for last articles
-articles_df = pd.concat(articles, ignore_index=True)
-#articles_df.to_csv("../../data/raw/articles/articles"+str(m)+".tsv", sep="\t")
-
-filtered_articles = prep_articles.filter_keywords(articles_df, config=config)
-
-filtered_articles = prep_articles.filter_by_domain(filtered_articles, domain_id="https://openalex.org/domains/1")
-
-#filtered_articles.to_pickle("../../data/interim/keyword-filtered_articles/articles"+str(m)+".pkl")
-print(f"[DEBUG] Saving {len(filtered_articles)} articles to: {interim_dir / f'articles{m}.pkl'}")
-filtered_articles.to_pickle(interim_dir / f"articles{m}.pkl")
-#eu_articles = prep_articles.filter_eu_articles(filtered_articles)
-#eu_articles.to_pickle("../../data/interim/eu_keyword-filtered_articles/eu_articles"+str(m)+".pkl")
-m += 1
 
-# putting it together
-#articles = prep_articles.merge_pkls("../../data/interim/keyword-filtered_articles/")
-articles = prep_articles.merge_pkls(str(interim_dir.resolve()) + "/")
-#eu_articles = prep_articles.merge_pkls("../../data/interim/eu_keyword-filtered_articles/")
+    # === Load configuration ===
+    if not config_path.exists():
+        raise FileNotFoundError(f"Config file not found at {config_path}")
+
+    ts("Loading config...")
+
+    with open(config_path, "r", encoding="utf-8") as config_file:
+        config = json.load(config_file)
+
+    ts("Config loaded")
+
+    # Extract dates
+    from_date = config.get("from_date", "2014-01-01")  # Default to 2014-01-01 if not provided
+    to_date = config.get("to_date", "2023-12-31")      # Default to 2023-12-31 if not provided
+
+    if not validate_date(from_date) or not validate_date(to_date):
+        raise ValueError("Invalid date format in configuration. Use YYYY-MM-DD.")
+
+    print("From ="+from_date+" To ="+to_date)
+
+    # number of journals paged at once (they share the request budget of download.get_client())
+    harvest_config = config.get("harvest", {})
+
+    journals = pd.read_csv(journals_path)
+    if journals is None:
+        raise ValueError("No journals were loaded — check input files or download step.")
+
+    # clear directory, but keep the checkpoints of an interrupted harvest if we resume it
+    articles_dir.mkdir(parents=True, exist_ok=True)
+    checkpoint_dir = articles_dir / "checkpoints"
+    resume = harvest_config.get("resume", False)
+    files = glob.glob(str(articles_dir / "*"))
+    #files.extend(glob.glob("../../data/interim/eu_keyword-filtered_articles/*"))
+    for f in files:
+        if Path(f) == checkpoint_dir:
+            if not resume:
+                shutil.rmtree(f)
+        else:
+            os.remove(f)
+
+    if resume and checkpoint_dir.exists():
+        print(f"Resuming harvest from checkpoints in {checkpoint_dir}")
+
+    # in incremental mode, only ask for works created or updated since each journal was last harvested
+    state_path = root_dir / "data" / "interim" / "harvest_state.json"
+    incremental = harvest_config.get("incremental", False)
+    harvest_started = datetime.now().strftime("%Y-%m-%d")
+    last_harvested = {}
+    if incremental and state_path.exists():
+        with open(state_path, "r", encoding="utf-8") as state_file:
+            state = json.load(state_file)
+        if state.get("from_date") == from_date and state.get("to_date") == to_date:
+            last_harvested = state.get("journals", {})
+        else:
+            print("Publication dates changed since the last harvest: harvesting all journals again")
+
+    # OpenAlex only accepts from_updated_date with a premium API key: without one, harvest everything
+    api_key = config.get("openalex_api_key")
+    if last_harvested and not api_key:
+        print("[WARNING] Incremental harvests need 'openalex_api_key' in config.json: harvesting all journals again")
+        last_harvested = {}
+
+    # only download the fields the pipeline reads
+    select = prep_articles.WORK_FIELDS if harvest_config.get("select_fields", False) else None
+
+    # keep every harvested work, with a postings index of its terms, so that refilter_articles.py
+    # can apply changed keywords or concepts without a new harvest
+    # (an incremental harvest adds the new and updated works to the existing store)
+    raw_works = work_index.WorkIndex(root_dir / "data" / "interim" / "raw_works")
+    if not last_harvested:
+        raw_works.reset()
+
+    # keyword-filtered articles are appended batch by batch to a Parquet store partitioned by journal
+    # and publication year (article_store.py); an incremental harvest appends the new and updated works,
+    # whose latest versions replace the old ones on reading
+    filtered_store = article_store.ArticleStore(interim_dir / "filtered_articles")
+    if not last_harvested:
+        filtered_store.reset()
+    elif filtered_store.is_empty() and (interim_dir / "filtered_articles.pkl").exists():
+        # articles of the last harvest, by a version without the store
+        filtered_store.append(pd.read_pickle(interim_dir / "filtered_articles.pkl"))
+    n_stored = len(filtered_store.read(columns=["id"]))
+
+    filtered_parts = []
+
+    def store_filtered(filtered_articles, flush=False):
+        """
+        Flatten keyword-filtered articles and append them to the store, at least 10 000 at a time
+        (or all that are left with `flush`), so that the few articles kept from every batch
+        do not each become a file.
+        """
+        if not filtered_articles.empty:
+            filtered_parts.append(filtered_articles)
+        if not filtered_parts or (not flush and sum(len(part) for part in filtered_parts) < 10000):
+            return
+        filtered_articles = pd.concat(filtered_parts, ignore_index=True)
+        filtered_parts.clear()
+        print(f"[DEBUG] Storing {len(filtered_articles)} articles in {filtered_store.directory}")
+        filtered_store.append(prep_articles.flatten_works(filtered_articles))
+
+    # works outside the domain of life sciences are left out by OpenAlex itself (topics.domain.id:1),
+    # instead of being downloaded and dropped by prep_articles.filter_by_domain
+    predicates = [download.WorkPredicate("topics.domain.id", ["https://openalex.org/domains/1"])]
+
+    def journal_filter(batch):
+        """
+        Filter string for one or more journals, limited to recent changes if they were harvested before
+        (journals in one batch were all last harvested on the same date).
+        """
+        filter_string = "primary_location.source.id:"+"|".join(batch)
+        if batch[0] in last_harvested:
+            filter_string += ",from_updated_date:"+last_harvested[batch[0]]
+        return filter_string
+
+    # ask OpenAlex (nicely) for all articles from these journals from 2014-2023
+    # can only use journals that have OpenAlex IDs and that are not dissolved
+    # (sorted, so that a resumed harvest builds the same batches of journals)
+    oaids = sorted(set(journals[journals["dissolved"]!=True]["openAlexID"].dropna()))
+    #email = input("Enter e-mail address for OpenAlex API: ")
+    email = config.get("email")
+
+    if not email:
+        raise ValueError("Email address for OpenAlex API is missing in config.json")
+    print("using email: "+email)
+
+    # keyword filtering is spread over a pool of processes (harvest.filter_workers, all cores by default),
+    # started before the harvest threads
+    filter_pool = prep_articles.FilterPool(config, workers=harvest_config.get("filter_workers"))
+
+    # most journals have only a few European articles: ask for several journals per query
+    # (journals last harvested on different dates go into different queries)
+    def journal_batches_of(source_ids):
+        journals_by_date = {}
+        for oaid in source_ids:
+            journals_by_date.setdefault(last_harvested.get(oaid), []).append(oaid)
+        return [batch for group in journals_by_date.values()
+                for batch in download.batch_source_ids(
+                    group, max_ids=harvest_config.get("journals_per_query", 1))]
+
+    # mega-journals such as PLOS ONE (~240 000 articles) would fill the memory as one query result:
+    # a journal with more works than harvest.mega_journal_threshold (by one group_by count per query)
+    # is paged on its own, and goes through the keyword filter in batches as its pages arrive
+    # (journals whose count fails twice are paged on their own as well, as any could be a mega-journal)
+    ts("Counting the articles of every journal")
+    mega_threshold = harvest_config.get("mega_journal_threshold", 20000)
+    source_counts = {}
+    uncounted = set()
+    for batch in journal_batches_of(oaids):
+        for attempt in range(2):
+            counts = download.count_works_by_source(journal_filter(batch), email, from_date=from_date,
+                                                    to_date=to_date, api_key=api_key, predicates=predicates)
+            if counts is not None:
+                source_counts.update(counts)
+                break
+        else:
+            print(f"[WARNING] Could not count the articles of {len(batch)} journals: paging them one by one")
+            uncounted.update(batch)
+    mega_journals = [oaid for oaid in oaids if source_counts.get(oaid, 0) > mega_threshold or oaid in uncounted]
+    for oaid in mega_journals:
+        if oaid in source_counts:
+            print(f"Mega-journal {oaid}: {source_counts[oaid]} articles, filtered in batches as its pages arrive")
+
+    # download recent articles from every other taxonomic journal
+    journal_batches = journal_batches_of([oaid for oaid in oaids if oaid not in mega_journals])
+
+    def harvest_journals(batches):
+        """
+        Yield the articles of every journal, in the order of the batches.
+        Several queries are paged at once, and each result is split back per journal.
+        """
+        harvest = download.harvest_works([journal_filter(batch) for batch in batches], email,
+                                         workers=harvest_config.get("workers", 1),
+                                         from_date=from_date, to_date=to_date,
+                                         checkpoint_dir=checkpoint_dir, api_key=api_key, select=select,
+                                         predicates=predicates)
+        for batch, (_, batch_articles) in zip(batches, harvest):
+            yield from download.split_by_source(batch_articles, batch).values()
+
+    def harvest_batches(batch_size=10000):
+        """
+        Yield all harvested articles in DataFrames of about `batch_size`: the pages of every
+        mega-journal, then the other journals (by confirmed OpenAlex ID, from OpenAlex itself
+        or Wikidata).
+        """
+        # (a mega-journal is paged in publication-date slices by harvest.workers cursors at once;
+        # its pages of 200 works are put together, so that filter_pool spreads every batch over all its processes)
+        for oaid in mega_journals:
+            pages = []
+            n = 0
+            for page in download.iter_sliced_work_pages(journal_filter([oaid]), email,
+                                                        from_date=from_date, to_date=to_date,
+                                                        workers=harvest_config.get("workers", 1),
+                                                        slice_size=harvest_config.get("slice_size", 10000),
+                                                        checkpoint_dir=checkpoint_dir, api_key=api_key,
+                                                        select=select, predicates=predicates):
+                pages += page
+                n += len(page)
+                if n >= batch_size:
+                    yield pd.DataFrame.from_dict(pages)
+                    pages = []
+                    n = 0
+            if pages:
+                yield pd.DataFrame.from_dict(pages)
+            yield JournalDone(oaid)
 
-# preprocess
-articles = prep_articles.flatten_works(articles)
-#eu_articles = prep_articles.flatten_works(eu_articles)
-
-# save final version of all (European) keyword-filtered taxonomic articles together
-#articles.to_pickle("../../data/interim/filtered_articles.pkl")
-#articles.to_csv("../../data/interim/filtered_articles.tsv", sep="\t")
-articles.to_pickle(interim_dir / "filtered_articles.pkl")
-articles.to_csv(interim_dir / "filtered_articles.tsv", sep="\t")
-
-#eu_articles.to_pickle("../../data/interim/eu_filtered_articles.pkl")
-#eu_articles.to_csv("../../data/interim/eu_filtered_articles.tsv", sep="\t")
-
-print("Taxonomic articles filtered. Results in data/interim/filtered_articles.tsv.")
+        articles = []
+        n = 0
+        for journal_articles in harvest_journals(journal_batches):
+            n += len(journal_articles)
+            articles.append(journal_articles)
+            # split the dataframe every 10 000 articles
+            if n >= batch_size:
+                print("Another "+str(n)+" articles found")
+                yield pd.concat(articles, ignore_index=True)
+                articles = []
+                n = 0
+        # same procedure for last articles
+        if articles:
+            yield pd.concat(articles, ignore_index=True)
+
+    def keep_raw(articles_df):
+        """Add a batch to the raw store, for refilter_articles.py."""
+        if not isinstance(articles_df, JournalDone):
+            raw_works(articles_df.to_dict("records"))
+        return articles_df
+
+    def keyword_filter(articles_df):
+        """Keyword-filter a batch in filter_pool."""
+        if isinstance(articles_df, JournalDone):
+            return articles_df
+        return filter_pool(articles_df)
+
+    def store_kept(articles_df):
+        """
+        Store the kept articles of a batch. Once all pages of a mega-journal are stored, fail at
+        once if none of its articles were kept (an incremental harvest may find no new ones).
+        """
+        if not isinstance(articles_df, JournalDone):
+            store_filtered(articles_df)
+            return
+        oaid = articles_df.oaid
+        store_filtered(pd.DataFrame(), flush=True)
+        n_kept = len(filtered_store.read(columns=["id"], filters=[("journal", "=", oaid)]))
+        print(f"[DEBUG] Mega-journal {oaid}: {n_kept} articles after keyword filtering")
+        if n_kept == 0 and oaid not in last_harvested and oaid not in uncounted:
+            raise ValueError(f"No articles of mega-journal {oaid} were loaded — possibly none matched after filtering.")
+
+    # downloading, keeping the raw works, keyword filtering (in filter_pool) and storing the kept
+    # articles overlap: every stage runs in its own thread, with at most harvest.pipeline_queue
+    # batches waiting in front of each, so a slow stage holds the others back instead of filling memory
+    # (OpenAlex already filtered on the domain; from the filter on, the abstracts are kept as text only)
+    harvest = pipeline.Pipeline(harvest_batches(), [
+        ("raw store", keep_raw),
+        ("keyword filter", keyword_filter),
+        ("filtered store", store_kept),
+    ], maxsize=harvest_config.get("pipeline_queue", 2))
+    harvest.run()
+    store_filtered(pd.DataFrame(), flush=True)
+    filter_pool.close()
+    print(f"[DEBUG] {harvest.report()}")
+
+    # putting it together: the latest version of every stored article
+    # (in an incremental harvest, new and updated works replace their old versions)
+    articles = filtered_store.read()
+    if last_harvested:
+        print(f"Incremental harvest: {len(articles) - n_stored} new articles")
+
+    # save final version of all (European) keyword-filtered taxonomic articles together
+    #articles.to_pickle("../../data/interim/filtered_articles.pkl")
+    #articles.to_csv("../../data/interim/filtered_articles.tsv", sep="\t")
+    articles.to_pickle(interim_dir / "filtered_articles.pkl")
+    articles.to_csv(interim_dir / "filtered_articles.tsv", sep="\t")
+
+    #eu_articles.to_pickle("../../data/interim/eu_filtered_articles.pkl")
+    #eu_articles.to_csv("../../data/interim/eu_filtered_articles.tsv", sep="\t")
+
+    # the harvest is complete: the next run starts from scratch
+    raw_works.save()
+    shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
+    # remember when every journal was harvested, for the next incremental harvest; a journal
+    # whose query failed on the way keeps its former date, so its missed works are asked for again
+    finished = [oaid for oaid in mega_journals
+                if download.query_finished(journal_filter([oaid]), from_date, to_date)]
+    finished += [oaid for batch in journal_batches
+                 if download.query_finished(journal_filter(batch), from_date, to_date) for oaid in batch]
+    unfinished = set(oaids) - set(finished)
+    if unfinished:
+        print(f"[WARNING] {len(unfinished)} journals were not harvested completely: {sorted(unfinished)}")
+    last_harvested.update({oaid: harvest_started for oaid in finished})
+    with open(state_path, "w", encoding="utf-8") as state_file:
+        json.dump({"from_date": from_date, "to_date": to_date, "journals": last_harvested},
+                  state_file, indent=2)
+
+    # report what was downloaded and, with field projection, roughly how much that saved
+    # (not in replay-only mode: nothing was downloaded, and complete works may not be cached)
+    downloaded_mb = download.transfer_stats["bytes"] / 1e6
+    print(f"Downloaded {downloaded_mb:.1f} MB in {download.transfer_stats['requests']} requests")
+    # (measured on the first query of this harvest, whose projected page is in the response cache)
+    if select and journal_batches and not download.response_cache.replay_only:
+        ratio = download.projection_ratio(journal_filter(journal_batches[0]), email, select,
+                                          predicates=predicates, from_date=from_date, to_date=to_date,
+                                          api_key=api_key)
+        if ratio:
+            print(f"Field projection saved about {downloaded_mb * (ratio - 1):.1f} MB "
+                  f"(complete works are {ratio:.1f} times larger)")
+
+    print("Taxonomic articles filtered. Results in data/interim/filtered_articles.tsv.")
+
+
+# the harvest starts processes (the keyword filter pool), which import this script
+# again under the spawn start method (Windows, macOS): only run it as the main program
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# get all European taxonomic articles from taxonomic journals, 
+# read from a local copy of the OpenAlex snapshot instead of the API
+import pandas as pd
+import json
+from pathlib import Path
+# custom packages
+import download
+import prep_articles
+import work_index
+import article_store
+
+
+def main():
+    # === Path setup ===
+    this_dir = Path(__file__).resolve().parent
+    root_dir = this_dir.parents[1]
+
+    config_path = root_dir / "config" / "config.json"
+    journals_path = root_dir / "data" / "processed" / "journals.csv"
+    interim_dir = root_dir / "data" / "interim" / "keyword-filtered_articles"
+    interim_dir.mkdir(parents=True, exist_ok=True)
+
+    # === Load configuration ===
+    if not config_path.exists():
+        raise FileNotFoundError(f"Config file not found at {config_path}")
+
+    with open(config_path, "r", encoding="utf-8") as config_file:
+        config = json.load(config_file)
+
+    from_date = config.get("from_date", "2014-01-01")
+    to_date = config.get("to_date", "2023-12-31")
+    harvest_config = config.get("harvest", {})
+
+    snapshot_dir = harvest_config.get("snapshot_dir")
+    if not snapshot_dir or not Path(snapshot_dir).exists():
+        raise FileNotFoundError(f"OpenAlex snapshot not found at {snapshot_dir} (harvest.snapshot_dir in config.json)")
+
+    print("From ="+from_date+" To ="+to_date)
+
+    # same journals as get_articles.py: those with an OpenAlex ID that are not dissolved (PLOS ONE included)
+    journals = pd.read_csv(journals_path)
+    oaids = sorted(set(journals[journals["dissolved"]!=True]["openAlexID"].dropna()))
+
+    select = prep_articles.WORK_FIELDS if harvest_config.get("select_fields", False) else None
+    # the same predicates as the API query: works in the domain of life sciences
+    predicates = [download.WorkPredicate("topics.domain.id", ["https://openalex.org/domains/1"])]
+
+    # keep the raw works for refilter_articles.py, like get_articles.py does
+    raw_works = work_index.WorkIndex(root_dir / "data" / "interim" / "raw_works")
+    raw_works.reset()
+    # keyword-filtered articles go to the Parquet store as they are found, like get_articles.py does
+    filtered_store = article_store.ArticleStore(interim_dir / "filtered_articles")
+    filtered_store.reset()
+
+    # works are filtered and stored every 10 000, as the partitions are read, so a mega-journal
+    # like PLOS ONE is never held in full; a work found in several partitions is stored again in
+    # every version that passes the filter, and the latest partition it was found in decides
+    latest_partition = {}  # work ID -> number of the last partition with the work
+    kept_partition = {}  # work ID -> number of the last partition whose version was kept
+    batch, n_works = [], 0
+
+    def filter_and_store(works):
+        partitions = [work.pop("_partition") for work in works]
+        works = pd.DataFrame.from_dict(works).assign(_partition=partitions)
+        kept = filter_pool(works.drop_duplicates(subset="id", keep="last", ignore_index=True))
+        if kept.empty:
+            return
+        kept_partition.update(zip(kept["id"], kept["_partition"]))
+        filtered_store.append(prep_articles.flatten_works(kept.drop(columns="_partition")))
+
+    # (from here on the abstracts are kept as text only)
+    with prep_articles.FilterPool(config, workers=harvest_config.get("filter_workers")) as filter_pool:
+        for n, found in enumerate(download.iter_snapshot_works(
+                snapshot_dir, oaids, from_date=from_date, to_date=to_date,
+                workers=harvest_config.get("snapshot_workers"), select=select, predicates=predicates)):
+            if not found:
+                continue
+            raw_works(found)
+            n_works += len(found)
+            for work in found:
+                latest_partition[work["id"]] = n
+                batch.append(dict(work, _partition=n))
+            if len(batch) >= 10000:
+                filter_and_store(batch)
+                batch = []
+        if batch:
+            filter_and_store(batch)
+    raw_works.save()
+    print(f"Found {len(latest_partition)} articles by European authors in {len(oaids)} journals "
+          f"({n_works} versions)")
+
+    # save final version of all (European) keyword-filtered taxonomic articles together; a work
+    # whose latest version no longer passes the filter is left out
+    articles = filtered_store.read()
+    stale = [work_id for work_id, n in kept_partition.items() if latest_partition[work_id] > n]
+    if stale:
+        articles = articles[~articles["id"].isin(stale)].reset_index(drop=True)
+    articles.to_pickle(interim_dir / "filtered_articles.pkl")
+    articles.to_csv(interim_dir / "filtered_articles.tsv", sep="\t")
+
+    print("Taxonomic articles filtered. Results in data/interim/filtered_articles.tsv.")
+
+
+# the snapshot is read and filtered by pools of processes, which import this script again under
+# the spawn start method (Windows, macOS): only run it as the main program
+if __name__ == "__main__":
+    main()
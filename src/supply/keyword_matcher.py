@@ -0,0 +1,145 @@
+# MATCH MANY KEYWORDS AT ONCE WITH AN AHO-CORASICK AUTOMATON
+"""
+Multi-pattern keyword matching for the keyword filter of prep_articles.
+
+All keywords are compiled into one Aho-Corasick automaton, which finds every
+occurrence of every keyword in a single pass over the text, however many
+keywords (and languages) there are. The compiled automaton of the
+pyahocorasick package is used when it is installed; otherwise an equivalent
+pure-Python automaton is built.
+
+Two kinds of keywords are supported:
+- phrases, matched anywhere in the text (like `keyword in text`);
+- word pairs, matched as whole words with at most one other word in between,
+  like the regular expression \\bfirst\\b(?:\\s+\\S+)?\\s+\\bsecond\\b.
+"""
+
+try:
+    import ahocorasick
+except ImportError:  # fall back on the pure-Python automaton
+    ahocorasick = None
+
+
+def is_word_char(c):
+    """True for characters that regular expressions count as \\w."""
+    return c.isalnum() or c == "_"
+
+
+def is_boundary(text, i):
+    """True if position i of text is a word boundary (\\b)."""
+    before = i > 0 and is_word_char(text[i - 1])
+    after = i < len(text) and is_word_char(text[i])
+    return before != after
+
+
+class PythonAutomaton:
+    """Aho-Corasick automaton in pure Python, with the interface of ahocorasick.Automaton used here."""
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+    def add_word(self, word, value):
+        state = 0
+        for c in word:
+            if c not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[state][c] = len(self.goto) - 1
+            state = self.goto[state][c]
+        self.output[state].append(value)
+
+    def make_automaton(self):
+        # breadth-first: the failure link of a state points to the longest proper
+        # suffix of its string that is also a prefix of some word; the children
+        # of the root fail back to the root
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for c, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and c not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(c, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def iter(self, text):
+        """Yield (end index, value) for every occurrence of every word, in order of end index."""
+        state = 0
+        for i, c in enumerate(text):
+            while state and c not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(c, 0)
+            for value in self.output[state]:
+                yield i, value
+
+
+class KeywordMatcher:
+    """
+    Compiled set of phrases and word pairs, scanned in one pass over each text.
+
+    Args:
+        phrases (list of str): Keywords matched anywhere in the text.
+        word_pairs (list of tuple): (first, second) words matched as whole words,
+            with at most one other word between them.
+    """
+
+    def __init__(self, phrases=(), word_pairs=()):
+        self.pairs = [tuple(pair) for pair in word_pairs]
+        # what every needle means: ("phrase", keyword), ("first", pair) or ("second", pair)
+        self.roles = {}
+        for phrase in phrases:
+            self.roles.setdefault(phrase, []).append(("phrase", phrase))
+        for n, (first, second) in enumerate(self.pairs):
+            self.roles.setdefault(first, []).append(("first", n))
+            self.roles.setdefault(second, []).append(("second", n))
+
+        self.automaton = ahocorasick.Automaton() if ahocorasick else PythonAutomaton()
+        for needle in self.roles:
+            if needle:
+                self.automaton.add_word(needle, needle)
+        self.empty = not any(self.roles)
+        if not self.empty:
+            self.automaton.make_automaton()
+
+    def iter_matches(self, text):
+        """Yield every keyword found in text (phrases, and pairs as "first second"), in order."""
+        if not text or self.empty:
+            return
+        first_ends = {}  # pair -> end positions of its first word so far
+        for end, needle in self.automaton.iter(text):
+            start = end + 1 - len(needle)
+            whole_word = is_boundary(text, start) and is_boundary(text, end + 1)
+            for role, value in self.roles[needle]:
+                if role == "phrase":
+                    yield value
+                elif not whole_word:
+                    continue
+                elif role == "second" and self.pair_closes(text, first_ends.get(value, []), start):
+                    yield " ".join(self.pairs[value])
+            # record first words after checking second words, so that a pair
+            # (w, w) needs two occurrences
+            if whole_word:
+                for role, value in self.roles[needle]:
+                    if role == "first":
+                        first_ends.setdefault(value, []).append(end + 1)
+
+    @staticmethod
+    def pair_closes(text, first_ends, start):
+        """True if a first word ending at one of first_ends is separated from start by whitespace and at most one word."""
+        for first_end in reversed(first_ends):
+            if first_end >= start:
+                continue
+            gap = text[first_end:start]
+            n_words = len(gap.split())
+            if n_words > 1:
+                return False  # earlier first words are even further away
+            if gap[0].isspace() and gap[-1].isspace():
+                return True
+        return False
+
+    def first_match(self, text):
+        """The first keyword found in text, or None."""
+        return next(self.iter_matches(text), None)
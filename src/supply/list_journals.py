@@ -22,21 +22,18 @@ processed_dir = root_dir / "data" / "processed"
 # GET JOURNALS
 # 1. wikidata: journals with taxonomy (and similar concepts) as subject
 
-query = download.build_sparql_query(["Q8269924", 	# taxonomy
-                                     "Q11398", 		# biological classification
-                                     "Q1138178", 	# plant taxonomy
-                                     "Q1469725", 	# animal taxonomy
-                                     "Q522190", 	# biological nomenclature
-                                     "Q3310776", 	# botanical nomenclature
-                                     "Q3343211"]) 	# zoological nomenclature
-# query is too long, split in two
-query2 = download.build_sparql_query(["Q3516404", 	# systematics
-                                      "Q171184", 	# phylogenetics
-                                      "Q115135896"])# animal phylogeny
-# get the results of the query
-results = download.get_sparql_results(query)
-results2 = download.get_sparql_results(query2)
-wikidata_subjects_results = pd.concat([results, results2])
+subjects = ["Q8269924", 	# taxonomy
+            "Q11398", 		# biological classification
+            "Q1138178", 	# plant taxonomy
+            "Q1469725", 	# animal taxonomy
+            "Q522190", 		# biological nomenclature
+            "Q3310776", 	# botanical nomenclature
+            "Q3343211", 	# zoological nomenclature
+            "Q3516404", 	# systematics
+            "Q171184", 		# phylogenetics
+            "Q115135896"]	# animal phylogeny
+# one query for all subjects is too long: the subjects are queried in concurrent chunks
+wikidata_subjects_results = download.get_sparql_results_for_subjects(subjects)
 wikidata_subjects_results["source"] = "Wikidata taxonomic subject"
 
 print("Wikidata journals by subject: done", flush=True)
@@ -68,7 +65,8 @@ WHERE {
     SERVICE wikibase:label { bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }
 }"""
 
-ipni_zoobank_results = download.get_sparql_results(query3)
+# this query comes close to the WDQS timeout: fetch its results in pages of journal items
+ipni_zoobank_results = download.get_sparql_results(query3, page_size=5000)
 ipni_zoobank_results["source"] = "IPNI or ZooBank ID"
 print("Wikidata journals by IPNI or ZooBank ID: done", flush=True)
 
@@ -96,8 +94,10 @@ print("Preprocessing data... ", flush=True)
 
 # wikidata values are hidden in dictionaries: get them out
 # and convert country Q-number to two-letter code and update old OpenAlex-IDs (e.g. V123 to S123)
-prep_journals.get_values_wikidata(wikidata_subjects_results)
-prep_journals.get_values_wikidata(ipni_zoobank_results)
+# (the country lookup table is only asked from Wikidata again with "refresh_country_codes" in config.json)
+countries = prep_journals.get_country_codes(refresh=config.get("refresh_country_codes", False))
+prep_journals.get_values_wikidata(wikidata_subjects_results, countries)
+prep_journals.get_values_wikidata(ipni_zoobank_results, countries)
 
 # OpenAlex IDs
 openalex_results = prep_journals.homogenize_openalex(openalex_results)
@@ -12,8 +12,14 @@ import argparse
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--config", type=str, required=True)
+parser.add_argument("--replay-only", action="store_true",
+                    help="serve every OpenAlex and Wikidata request from data/cache; never use the network")
 args = parser.parse_args()
 
+# the scripts below run as subprocesses and inherit this environment
+if args.replay_only:
+    os.environ["REPLAY_ONLY"] = "1"
+
 with open(args.config, "r", encoding="utf-8") as f:
     config = json.load(f)
 
@@ -33,6 +39,8 @@ def log(msg):
     print(f"[{datetime.now().isoformat(timespec='seconds')}] {msg}")
 
 log(f"Loaded config from: {args.config}")
+if args.replay_only:
+    log("Replay-only mode: all responses come from data/cache/responses.")
 
 def run_script(script_relative_path):
     """Run a script using subprocess with proper error handling."""
@@ -76,6 +84,8 @@ for rel_dir in [
 # Step 3: Clean article directory
 log("Cleaning raw articles directory...")
 for f in Path("data/raw/articles").glob("*"):
+    if f.is_dir():  # harvest checkpoints are kept or cleared by get_articles.py
+        continue
     try:
         f.unlink()
     except Exception as e:
@@ -83,7 +93,13 @@ for f in Path("data/raw/articles").glob("*"):
 
 # Step 4: Run scripts in order
 run_script("list_journals.py")
-run_script("get_articles.py")
+# read articles from a local OpenAlex snapshot if there is one, otherwise from the API
+if config.get("harvest", {}).get("snapshot_dir"):
+    run_script("ingest_snapshot.py")
+else:
+    run_script("get_articles.py")
+# compile the GBIF backbone into Parquet, unless it was compiled from this version before
+run_script("gbif_backbone.py")
 run_script("parse_taxonomy.py")
 run_script("get_authors.py")
 run_script("disambiguate.py")
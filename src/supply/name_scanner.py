@@ -0,0 +1,197 @@
+# SCAN TEXTS FOR SCIENTIFIC NAMES OF THE GBIF BACKBONE
+"""
+Finds the canonical names of species (and infraspecific taxa) in titles and
+abstracts in a single pass over every text.
+
+One regular expression splits a text into candidates: a capitalized word (or an
+abbreviated genus like "G.") followed by one or two lowercase words. Every
+candidate is looked up in an index of the canonical names of the backbone, built
+once, preferring the trinomial "Genus species subspecies" over the binomial.
+Epithets may be hyphenated ("Capsella bursa-pastoris").
+
+The index has two levels, like the first two of a token trie: the set of genera,
+which rejects most candidates (sentence starts like "The results") with a single
+lookup, and the set of the names themselves.
+
+An abbreviation such as "P. abies" is resolved while scanning, against the
+genera already named in the text (the most recent first); one that comes before
+its genus is resolved at the end of the text.
+
+Both levels are plain sets, built at C speed (the genera are split off the names
+by pyarrow): a nested genus -> epithet -> infraspecific trie of millions of names
+takes longer to build in Python than the whole scan of the articles.
+
+Processes that scan at the same time share the names as a NameIndex instead: the
+sorted 64-bit hashes of the names in memory-mapped .npy files, which every
+process reads from the same pages of memory rather than holding its own set.
+"""
+import hashlib
+import re
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# a genus or abbreviated genus, an epithet and an optional infraspecific epithet
+# (a candidate holds only one capitalized word, so no candidate can start inside
+# another; there is no \b before the genus, which would be tried at every position)
+CANDIDATE = re.compile(r"([A-Z](?:[a-z]+|\.)) ([a-z-]+)(?: ([a-z-]+))?")
+
+
+def name_hash(name):
+    """64-bit hash of a name, the same in every process (unlike hash())."""
+    return int.from_bytes(hashlib.blake2b(name.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def first_words(names):
+    """Set of the first words (genera) of names, split off by pyarrow."""
+    words = pc.list_element(pc.split_pattern(pa.array(names, type=pa.string()), " ", max_splits=1), 0)
+    return set(pc.unique(words).to_pylist())
+
+
+class NameIndex:
+    """
+    Set-like index of names, kept as the sorted array of their name_hash values.
+
+    The hashes are grouped in buckets by their top bits (about one hash per bucket),
+    and `offsets` holds where every bucket starts, so a lookup reads one or two
+    numbers instead of searching the whole array. Saved to a folder of two .npy
+    files and loaded memory-mapped, one copy in memory serves all processes. Two
+    names share a hash with a chance of about 1 in 10^19, so a lookup may call a
+    name known that is not, but practically never does.
+
+    Args:
+        hashes (np.ndarray): Sorted, unique uint64 hashes.
+        offsets (np.ndarray): Position of the first hash of every bucket, and the
+            number of hashes last (a power of two plus one values).
+    """
+
+    def __init__(self, hashes, offsets):
+        self.hashes = hashes
+        self.offsets = offsets
+        self.shift = 64 - ((len(offsets) - 1).bit_length() - 1)  # 64 - bits of the bucket number
+        # memoryviews return plain ints, far faster to read one at a time than numpy
+        self._hashes = memoryview(np.ascontiguousarray(hashes)).cast("B").cast("Q")
+        self._offsets = memoryview(np.ascontiguousarray(offsets)).cast("B").cast("q")
+
+    @classmethod
+    def from_names(cls, names):
+        hashes = np.unique(np.fromiter((name_hash(name) for name in names), dtype=np.uint64, count=len(names)))
+        bits = max(1, len(hashes).bit_length())
+        starts = np.arange(2 ** bits, dtype=np.uint64) << np.uint64(64 - bits)
+        offsets = np.append(np.searchsorted(hashes, starts), len(hashes)).astype(np.int64)
+        return cls(hashes, offsets)
+
+    def save(self, directory):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / "hashes.npy", self.hashes)
+        np.save(directory / "offsets.npy", self.offsets)
+
+    @classmethod
+    def load(cls, directory):
+        """The index saved in a folder, memory-mapped (read-only)."""
+        directory = Path(directory)
+        return cls(np.load(directory / "hashes.npy", mmap_mode="r"),
+                   np.load(directory / "offsets.npy", mmap_mode="r"))
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __contains__(self, name):
+        key = name_hash(name)
+        bucket = key >> self.shift
+        hashes = self._hashes
+        for i in range(self._offsets[bucket], self._offsets[bucket + 1]):
+            if hashes[i] == key:
+                return True
+        return False
+
+
+class NameScanner:
+    """
+    Scanner of texts for the binomial and trinomial canonical names of a backbone.
+
+    Args:
+        names (set of str or NameIndex): Canonical names; anything else in it
+            (genera, families) is never matched.
+        genera (set of str): First word of every name (default: split off the names,
+            which must then be a set).
+    """
+
+    def __init__(self, names, genera=None):
+        self.names = names
+        self.genera = genera if genera is not None else first_words(list(names))
+
+    @classmethod
+    def from_backbone(cls, backbone):
+        """Scanner of the canonical names in a backbone DataFrame."""
+        names = backbone["canonicalName"].dropna()
+        return cls(set(names), first_words(names))
+
+    def match(self, genus, epithet, infra=None):
+        """The longest name of the index made of these words, or None."""
+        if genus not in self.genera:
+            return None
+        binomial = f"{genus} {epithet}"
+        if infra:
+            trinomial = f"{binomial} {infra}"
+            if trinomial in self.names:
+                return trinomial
+        if binomial in self.names:
+            return binomial
+        if "-" in epithet:  # e.g. "Genus species-group", "Genus species-complex"
+            return self.match(genus, epithet.split("-", 1)[0])
+        return None
+
+    def scan(self, text):
+        """
+        Names in a text, in order of appearance, each once.
+
+        Returns:
+            list of str: Canonical names (abbreviated genera written in full).
+        """
+        names, genera, found, named, pending = self.names, self.genera, [], [], []
+
+        def add(name):
+            if name not in found:
+                found.append(name)
+                genus = name.split(" ", 1)[0]
+                if genus in named:
+                    named.remove(genus)
+                named.append(genus)  # the most recent genus last
+
+        def resolve(initial, epithet, infra):
+            for genus in reversed(named):
+                if genus[0] == initial:
+                    name = self.match(genus, epithet, infra)
+                    if name:
+                        return name
+            return None
+
+        for first, epithet, infra in CANDIDATE.findall(text):
+            # the match() of a genus inlined, as most candidates are no name at all
+            if first not in genera:
+                if first[-1] == ".":
+                    name = resolve(first[0], epithet, infra)
+                    if name:
+                        add(name)
+                    else:
+                        pending.append((first[0], epithet, infra))
+                continue
+            binomial = f"{first} {epithet}"
+            if infra and f"{binomial} {infra}" in names:
+                add(f"{binomial} {infra}")
+            elif binomial in names:
+                add(binomial)
+            elif "-" in epithet:
+                name = self.match(first, epithet)
+                if name:
+                    add(name)
+
+        for initial, epithet, infra in pending:
+            name = resolve(initial, epithet, infra)
+            if name:
+                add(name)
+        return found
@@ -1,52 +1,59 @@
 import pandas as pd
 import glob
+import json
 import os
 # custom packages
+import prep_articles
 import prep_taxonomy
+import article_store
 
 from pathlib import Path
 import pandas as pd
 
-# Resolve absolute paths
-this_dir = Path(__file__).resolve().parent
-root_dir = this_dir.parents[1]
-interim_dir = root_dir / "data" / "interim" / "keyword-filtered_articles"
 
-# Full path to filtered_articles.pkl
-filtered_articles_path = interim_dir / "filtered_articles.pkl"
+def main():
+    # Resolve absolute paths
+    this_dir = Path(__file__).resolve().parent
+    root_dir = this_dir.parents[1]
+    interim_dir = root_dir / "data" / "interim" / "keyword-filtered_articles"
+    config_path = root_dir / "config" / "config.json"
 
-# PARSE ARTICLES FOR TAXONOMIC SUBJECTS
-articles = pd.read_pickle(filtered_articles_path)
+    # Full path to filtered_articles.pkl
+    filtered_articles_path = interim_dir / "filtered_articles.pkl"
 
-# convert abstract to text for every article
-abstracts = []
-
-for article in articles.itertuples():
-    if article.abstract_inverted_index: # check if abstract is indexed
-        abstract_full_text = prep_taxonomy.inverted_index_to_text(article.abstract_inverted_index)
-        abstracts.append(abstract_full_text)
+    # PARSE ARTICLES FOR TAXONOMIC SUBJECTS
+    # (from the Parquet store of the harvest, or from the pickle of an older version)
+    filtered_store = article_store.ArticleStore(interim_dir / "filtered_articles")
+    if not filtered_store.is_empty():
+        articles = filtered_store.read()
     else:
-        abstracts.append(None)
-
-articles["abstract_full_text"] = pd.DataFrame(abstracts)
-print("Abstract inverted indices converted to texts")
-
-# >>> CLEAN UP CARRIAGE RETURNS AND NEWLINES HERE <<<
-articles["abstract_full_text"] = (
-    articles["abstract_full_text"]
-    .astype(str)                            # ensure string type
-    .str.replace(r"[\r\n]+", " ", regex=True)  # replace any \r or \n with a space
-    .str.strip()                                # remove leading/trailing spaces
-)
-
-# parse every article abstract and title for mentions of recorded species
-backbone = prep_taxonomy.preprocess_backbone() # GBIF taxonomic backbone
-articles = prep_taxonomy.parse_for_taxonomy(articles, backbone)
-
-processed_dir = root_dir / "data" / "processed"
-processed_dir.mkdir(parents=True, exist_ok=True)  # make sure directory exists
-
-articles.to_pickle(processed_dir / "taxonomic_articles_with_subjects.pkl")
-articles.to_csv(processed_dir / "taxonomic_articles_with_subjects.tsv", sep="\t")
-print("Taxonomic articles parsed for taxonomic subjects. Results in data/processed/taxonomic_articles_with_subjects.tsv.")
- 
\ No newline at end of file
+        articles = pd.read_pickle(filtered_articles_path)
+
+    # the abstracts were converted to text (abstract_full_text, without line breaks) when the
+    # articles were filtered; only convert them here for articles filtered by an older version
+    articles = prep_articles.materialize_abstracts(articles)
+    print("Abstract texts ready")
+
+    # parse every article abstract and title for mentions of recorded species
+    # (in taxonomy.workers processes, all cores by default; 1 scans in this process)
+    with open(config_path, "r", encoding="utf-8") as config_file:
+        taxonomy_config = json.load(config_file).get("taxonomy", {})
+    backbone = prep_taxonomy.preprocess_backbone() # GBIF taxonomic backbone
+    articles = prep_taxonomy.parse_for_taxonomy(articles, backbone, workers=taxonomy_config.get("workers"))
+
+    processed_dir = root_dir / "data" / "processed"
+    processed_dir.mkdir(parents=True, exist_ok=True)  # make sure directory exists
+
+    articles.to_pickle(processed_dir / "taxonomic_articles_with_subjects.pkl")
+    articles.to_csv(processed_dir / "taxonomic_articles_with_subjects.tsv", sep="\t")
+    # the same articles partitioned by journal and year, for scripts that only read a few columns
+    taxonomic_store = article_store.ArticleStore(processed_dir / "taxonomic_articles")
+    taxonomic_store.reset()
+    taxonomic_store.append(articles)
+    print("Taxonomic articles parsed for taxonomic subjects. Results in data/processed/taxonomic_articles_with_subjects.tsv.")
+
+
+# the species are found by a pool of processes, which import this script again under the
+# spawn start method (Windows, macOS): only run it as the main program
+if __name__ == "__main__":
+    main()
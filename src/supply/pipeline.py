@@ -0,0 +1,125 @@
+# PIPELINE OF STAGES CONNECTED BY BOUNDED QUEUES
+"""
+Runs a producer and a chain of stages at the same time, each in its own thread,
+connected by bounded queues: e.g. downloading works, filtering them and writing
+the kept ones. While one stage waits on the network, another can use the CPU (a
+FilterPool works in other processes) and a third can write to disk.
+
+A stage that falls behind fills the queue in front of it, and the stages before
+it then wait instead of piling up batches: at most `maxsize` items wait between
+two stages, which caps the memory the pipeline takes.
+
+The first error in any stage stops the whole pipeline and is raised by run().
+"""
+import queue
+import threading
+import time
+
+DONE = object()  # end of the items, passed down the queues
+
+
+class Pipeline:
+    """
+    A source of items and the stages they go through, in order.
+
+    Args:
+        source (iterable): Items for the first stage, e.g. batches of works from a generator.
+        stages (list of (str, callable)): Name and function of every stage. A function
+            gets the result of the stage before it; returning None drops the item.
+        maxsize (int): Most items waiting in front of every stage.
+
+    Attributes:
+        busy (dict): Seconds every stage (and "source") spent working, after run().
+        counts (dict): Items handled by every stage (and "source"), after run().
+    """
+
+    def __init__(self, source, stages, maxsize=2):
+        self.source = source
+        self.stages = list(stages)
+        self.maxsize = maxsize
+        names = ["source"] + [name for name, _ in self.stages]
+        self.busy = {name: 0.0 for name in names}
+        self.counts = {name: 0 for name in names}
+
+    def run(self):
+        """Run until the source is exhausted and every item went through all stages."""
+        queues = [queue.Queue(self.maxsize) for _ in self.stages]
+        stop = threading.Event()
+        errors = []
+
+        def put(q, item):
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(q):
+            while not stop.is_set():
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return DONE
+
+        def fail(error):
+            errors.append(error)
+            stop.set()
+
+        def produce():
+            items = iter(self.source)
+            try:
+                while True:
+                    start = time.perf_counter()
+                    item = next(items, DONE)
+                    self.busy["source"] += time.perf_counter() - start
+                    if item is DONE or not put(queues[0], item):
+                        break
+                    self.counts["source"] += 1
+            except BaseException as e:
+                fail(e)
+            finally:
+                if hasattr(items, "close"):
+                    items.close()
+                put(queues[0], DONE)
+
+        def work(i, name, function):
+            out = queues[i + 1] if i + 1 < len(queues) else None
+            try:
+                while True:
+                    item = get(queues[i])
+                    if item is DONE:
+                        break
+                    start = time.perf_counter()
+                    result = function(item)
+                    self.busy[name] += time.perf_counter() - start
+                    self.counts[name] += 1
+                    if out is not None and result is not None and not put(out, result):
+                        break
+            except BaseException as e:
+                fail(e)
+            finally:
+                if out is not None:
+                    put(out, DONE)
+
+        threads = [threading.Thread(target=produce, name="source", daemon=True)]
+        threads += [threading.Thread(target=work, args=(i, name, function), name=name, daemon=True)
+                    for i, (name, function) in enumerate(self.stages)]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        except BaseException:
+            stop.set()
+            raise
+
+        if errors:
+            raise errors[0]
+
+    def report(self):
+        """One line with the items and busy time of every stage."""
+        return ", ".join(f"{name}: {self.counts[name]} items in {self.busy[name]:.0f} s"
+                         for name in self.busy)
@@ -1,11 +1,24 @@
 # FUNCTIONS TO FILTER AND PREPROCESS ARTICLES FROM OPENALEX 
 import pandas as pd
-import glob
+import numpy as np
 import prep_taxonomy
+import prep_authors
+import keyword_matcher
 import re
 import unicodedata
+import multiprocessing
 import json
 from pathlib import Path
+from functools import lru_cache
+
+# the fields of an OpenAlex work that the pipeline reads: 
+# filter_keywords, filter_by_domain and flatten_works here, and parse_for_taxonomy in prep_taxonomy,
+# then those that get_authors in prep_authors declares (prep_authors.AUTHOR_FIELDS).
+# Harvests can ask OpenAlex for only these fields.
+ARTICLE_FIELDS = ["id", "display_name", "title", "publication_date",
+                  "abstract_inverted_index", "concepts", "topics", "primary_topic",
+                  "primary_location", "open_access"]
+WORK_FIELDS = ARTICLE_FIELDS + [field for field in prep_authors.AUTHOR_FIELDS if field not in ARTICLE_FIELDS]
 
 def load_config(config_path=None):
     """
@@ -36,7 +49,7 @@ def load_config(config_path=None):
         print(f"ERROR: Error parsing JSON configuration: {e}")
         raise
 
-def validate_config(config):
+def validate_config(config, verbose=True):
     """
     Validate the presence and structure of required sections in the config.
 
@@ -60,7 +73,8 @@ def validate_config(config):
     if not isinstance(config['concepts'], list):
         raise ValueError("'concepts' should be a list.")
 
-    print("Configuration validation passed.")
+    if verbose:
+        print("Configuration validation passed.")
 
 def normalize_text(s):
     """
@@ -72,61 +86,100 @@ def normalize_text(s):
         return ""
     return unicodedata.normalize("NFC", s).lower()
 
+# columns made by flatten_works, in order: location_<field>, source_<field>, oa_<field>
+# (fields OpenAlex adds later are left out; fields it does not provide are None)
+LOCATION_FIELDS = ["is_oa", "landing_page_url", "pdf_url", "source", "license", "license_id",
+                   "version", "is_accepted", "is_published"]
+SOURCE_FIELDS = ["id", "display_name", "issn_l", "issn", "is_oa", "is_in_doaj", "is_indexed_in_scopus",
+                 "is_core", "host_organization", "host_organization_name", "host_organization_lineage",
+                 "host_organization_lineage_names", "type"]
+OPEN_ACCESS_FIELDS = ["is_oa", "oa_status", "oa_url", "any_repository_has_fulltext"]
+
+# not all sources have "is_oa" and "is_in_doaj" provided
+SOURCE_DEFAULTS = {"is_oa": "unknown", "is_in_doaj": "unknown"}
+
 # release information locked in dictionaries inside the dataframe: open access, host (journal)
 def flatten_works(df_input): # input: articles straight from openalex
-    # find an example row to infer column names from
-    i = 0
-    example_row = None
-    while example_row is None:
-        row = df_input.iloc[i]
-        # needs to have an available source with all expected fields
-        if row["primary_location"]["source"] != None:
-            if "is_oa" in row["primary_location"]["source"] \
-            and "is_in_doaj" in row["primary_location"]["source"]:
-                example_row = row
-                length_source = len(row["primary_location"]["source"])
-        else:
-            i += 1
-            
-    new_cols = ["location_" + x for x in example_row["primary_location"].keys()] + \
-               ["source_" + x for x in example_row["primary_location"]["source"].keys()] + \
-               ["oa_" + x for x in example_row["open_access"].keys()] 
-    new_rows = []
-    
-    for article in df_input.itertuples():
-        # get host (journal) info
-        # if there is a list within the dictionary, pandas will turn it into two rows
-        # LOCATION
-        l_location = list(article.primary_location.values())
-        
-        # SOURCE
-        if article.primary_location["source"] != None:
-            if article.primary_location["source"]["issn"] != None and len(article.primary_location["source"]["issn"]) != 1:
-                # get everything about source
-                article.primary_location["source"]["issn"] = ','.join(article.primary_location["source"]["issn"])
-            l_source = list(article.primary_location["source"].values())
-            
-            # not all sources have "is_oa" and "is_in_doaj" provided
-            if "is_oa" not in article.primary_location["source"]:
-                l_source.insert(4, "unknown")
-            if "is_in_doaj" not in article.primary_location["source"]:
-                l_source.insert(5, "unknown")
-
-        else:
-            l_source = [None,] * length_source
-        
-        # OPEN ACCESS
-        l_oa = list(article.open_access.values())
-        
-        # UNITE
-        l_new = l_location + l_source + l_oa
-        new_rows.append(l_new)
-        
+    """
+    Add the fields of primary_location, its source and open_access as columns
+    (LOCATION_FIELDS, SOURCE_FIELDS and OPEN_ACCESS_FIELDS), so that the columns do not
+    depend on the fields of an example row. ISSN lists are joined with commas.
+    """
+    columns = {}
+
+    # LOCATION
+    locations = [x if isinstance(x, dict) else {} for x in df_input["primary_location"]]
+    for field in LOCATION_FIELDS:
+        columns["location_" + field] = [location.get(field) for location in locations]
+
+    # SOURCE (all None without a source)
+    sources = [source if isinstance(source, dict) else None for source in columns["location_source"]]
+    for field in SOURCE_FIELDS:
+        default = SOURCE_DEFAULTS.get(field)
+        columns["source_" + field] = [None if source is None else source.get(field, default)
+                                      for source in sources]
+    columns["source_issn"] = [",".join(issn) if isinstance(issn, list) else issn
+                              for issn in columns["source_issn"]]
+
+    # OPEN ACCESS
+    open_access = [x if isinstance(x, dict) else {} for x in df_input["open_access"]]
+    for field in OPEN_ACCESS_FIELDS:
+        columns["oa_" + field] = [oa.get(field) for oa in open_access]
+
     # unite data in dictionaries with accessible data
-    new_df = pd.DataFrame(new_rows, columns=new_cols)
-    return df_input.merge(new_df, left_index=True, right_index=True)
+    new_df = pd.DataFrame(columns, index=df_input.index, dtype=object)
+    return pd.concat([df_input, new_df], axis=1, copy=False)
+
+def abstract_texts(articles):
+    """
+    Abstract texts of articles: the abstract_full_text column if they have one,
+    else reconstructed from abstract_inverted_index (NFC-normalized, without line breaks).
+
+    Returns:
+        pd.Series: Texts, None for articles without an abstract.
+    """
+    if "abstract_full_text" in articles.columns:
+        return articles["abstract_full_text"]
+    texts = articles["abstract_inverted_index"].map(
+        lambda aii: prep_taxonomy.inverted_index_to_text(aii) if isinstance(aii, dict) else None
+    )
+    return texts.map(
+        lambda t: re.sub(r"[\r\n]+", " ", unicodedata.normalize("NFC", t)).strip() if t is not None else None
+    )
+
+
+def materialize_abstracts(articles):
+    """
+    Keep the abstracts of articles as text only: add abstract_full_text if needed and
+    drop the inverted indexes (and the lowercase abstract_text of filter_keywords),
+    so that the later stages load far less data.
+    """
+    if not articles.empty:
+        articles = articles.assign(abstract_full_text=abstract_texts(articles))
+    return articles.drop(columns=["abstract_inverted_index", "abstract_text"], errors="ignore")
+
+
+@lru_cache(maxsize=8)
+def build_keyword_matchers(single_words, two_words):
+    """
+    Compile the keyword lists into the title and abstract matchers of filter_keywords.
+
+    Keywords are normalized like the texts they are matched against. The matchers
+    are cached, so filtering page by page compiles them only once.
+
+    Returns:
+        tuple: (title matcher, abstract matcher), both keyword_matcher.KeywordMatcher.
+    """
+    single_words = [normalize_text(k) for k in single_words]
+    two_words = [normalize_text(k) for k in two_words]
+    title_matcher = keyword_matcher.KeywordMatcher(single_words + two_words + ["nov."])
+    abstract_matcher = keyword_matcher.KeywordMatcher(
+        single_words + ["nov."],
+        word_pairs=[w.split() for w in two_words if len(w.split()) == 2]
+    )
+    return title_matcher, abstract_matcher
 
-def filter_keywords(articles, config=None):
+def filter_keywords(articles, config=None, verbose=True):
     # Load and validate config
     if config is None:
         try:
@@ -137,11 +190,15 @@ def filter_keywords(articles, config=None):
             return pd.DataFrame()
     else:
         try:
-            validate_config(config)
+            validate_config(config, verbose=verbose)
         except Exception as e:
             print(f"[CRITICAL] Configuration validation failed: {e}")
             return pd.DataFrame()
 
+    # Nothing to filter (e.g. no new works in an incremental harvest)
+    if articles.empty:
+        return articles.copy()
+
     # Prepare keyword lists
     single_words = config["keywords"]["single_word"]
     two_words = config["keywords"]["two_word"]
@@ -153,42 +210,75 @@ def filter_keywords(articles, config=None):
     # Normalize display_name (title)
     articles["display_name_norm"] = articles["display_name"].fillna("").apply(normalize_text)
 
-    # Compile title pattern (single + two-word + nov.)
-    title_keywords = single_words + two_words + ["nov."]
-    title_pattern = "|".join(re.escape(k) for k in title_keywords)
-    mask_title = articles["display_name_norm"].str.contains(title_pattern, na=False)
+    # Match all keywords in one pass per text (title: single + two-word + nov.)
+    title_matcher, abstract_matcher = build_keyword_matchers(tuple(single_words), tuple(two_words))
+    title_matches = articles["display_name_norm"].map(title_matcher.first_match)
+    mask_title = title_matches.notna()
 
-    # Process abstract_inverted_index to flat text
-    articles["abstract_text"] = articles["abstract_inverted_index"].apply(
-        lambda x: normalize_text(prep_taxonomy.inverted_index_to_text(x)) if isinstance(x, dict) else ""
-    )
+    # Abstract texts: reconstructed from abstract_inverted_index once (kept in abstract_full_text)
+    articles["abstract_full_text"] = abstract_texts(articles)
+    articles["abstract_text"] = articles["abstract_full_text"].fillna("").map(normalize_text)
 
-    # Compile abstract pattern
-    two_word_patterns = [
-        rf"\b{re.escape(w.split()[0])}\b(?:\s+\S+)?\s+\b{re.escape(w.split()[1])}\b"
-        for w in two_words if len(w.split()) == 2
-    ]
-    abstract_pattern = "|".join(two_word_patterns + [re.escape(k) for k in single_words + ["nov."]])
-    mask_abstract = articles["abstract_text"].str.contains(abstract_pattern, regex=True, na=False)
+    # Abstract: two-word keywords as whole words (at most one word in between), single words + nov.
+    abstract_matches = articles["abstract_text"].map(abstract_matcher.first_match)
+    mask_abstract = abstract_matches.notna()
 
     # Check concept IDs
     mask_concepts = articles["concepts"].apply(
         lambda c: any(con.get("id") in concept_ids for con in c) if isinstance(c, list) else False
     )
 
-    # Combine all matches
+    # Combine all matches, recording which keyword (or concept) selected each article
     combined_mask = mask_title | mask_abstract | mask_concepts
+    articles["matched_keyword"] = title_matches.fillna(abstract_matches).fillna(
+        articles["concepts"].apply(
+            lambda c: next((con.get("id") for con in c if con.get("id") in concept_ids), None)
+            if isinstance(c, list) else None
+        )
+    )
     filtered = articles[combined_mask].drop_duplicates(subset="id", ignore_index=True)
 
     # Debug output
-    print(f"[DEBUG] Matched on title: {mask_title.sum()}")
-    print(f"[DEBUG] Matched on abstract: {mask_abstract.sum()}")
-    print(f"[DEBUG] Matched on concepts: {mask_concepts.sum()}")
-    print(f"[DEBUG] Total unique matches: {len(filtered)}")
+    if verbose:
+        print(f"[DEBUG] Matched on title: {mask_title.sum()}")
+        print(f"[DEBUG] Matched on abstract: {mask_abstract.sum()}")
+        print(f"[DEBUG] Matched on concepts: {mask_concepts.sum()}")
+        print(f"[DEBUG] Total unique matches: {len(filtered)}")
 
     return filtered
 
 
+def filter_keywords_indexed(index, config=None, exclude_ids=(), verbose=True):
+    """
+    Keyword-filter the works kept by get_articles.py without reading them all.
+
+    The postings index of the raw store narrows the works down to those that
+    contain every word of a keyword, or one of the concepts. Only these are read
+    back and checked with filter_keywords, so the result is the same as filtering
+    every stored work.
+
+    Parameters:
+        index (work_index.WorkIndex): Raw store of harvested works.
+        config (dict): Configuration with the keywords and concepts. If None, use default.
+        exclude_ids (collection): IDs of works not to read back (e.g. filtered before).
+
+    Returns:
+        pd.DataFrame: Matching works, as filter_keywords returns them.
+    """
+    if config is None:
+        config = load_config()
+    validate_config(config, verbose=False)  # filter_keywords reports it
+
+    keywords = config["keywords"]["single_word"] + config["keywords"]["two_word"] + ["nov."]
+    exclude_ids = set(exclude_ids)
+    work_ids = [i for i in index.candidates(keywords, config["concepts"]) if i not in exclude_ids]
+    if verbose:
+        print(f"[DEBUG] Candidates from the postings index: {len(work_ids)} of {len(index)} works")
+
+    works = pd.DataFrame.from_dict(index.fetch(work_ids))
+    return filter_keywords(works, config=config, verbose=verbose)
+
+
 def filter_keywords_to_delete(articles, config=None):
     print(f"[DEBUG] Starting filter_keywords with {len(articles)} articles", flush=True)
 
@@ -287,6 +377,15 @@ def filter_keywords_to_delete(articles, config=None):
 
 
 
+def has_domain(primary_topic, topics, domain_id):
+    """Whether the primary topic or one of the topics of a work is in the domain."""
+    if isinstance(primary_topic, dict) and ((primary_topic.get("domain") or {}).get("id") == domain_id):
+        return True
+    if not isinstance(topics, list):
+        return False
+    return any((t.get("domain") or {}).get("id") == domain_id for t in topics if isinstance(t, dict))
+
+
 def filter_by_domain(articles_df, domain_id = "https://openalex.org/domains/1"):
     """
     Given a DataFrame of article records (after your main filter),
@@ -294,38 +393,122 @@ def filter_by_domain(articles_df, domain_id = "https://openalex.org/domains/1"):
     
     The function looks for the domain ID in both 'primary_topic' and 'topics'.
     """
-    keep = []
-    
-    for article in articles_df.itertuples():
-        # Convert namedtuple to dict for easier key-based access
-        article_dict = article._asdict()
-        
-        # 1. Check 'primary_topic'
-        primary_topic = article_dict.get("primary_topic")
-        if primary_topic and "domain" in primary_topic:
-            if primary_topic["domain"].get("id") == domain_id:
-                keep.append(article)
-                continue  # proceed to next article
+    if articles_df.empty:
+        return articles_df
 
-        # 2. Check each topic in the 'topics' array
-        topics = article_dict.get("topics", [])
-        for t in topics:
-            domain_info = t.get("domain")
-            if domain_info and domain_info.get("id") == domain_id:
-                keep.append(article)
-                break  # no need to look at more topics for this article
+    n = len(articles_df)
+    primary_topics = articles_df["primary_topic"] if "primary_topic" in articles_df.columns else [None] * n
+    topics = articles_df["topics"] if "topics" in articles_df.columns else [None] * n
+    mask = np.fromiter((has_domain(p, t, domain_id) for p, t in zip(primary_topics, topics)),
+                       dtype=bool, count=n)
 
     # Return a DataFrame of unique articles
-    return pd.DataFrame(keep).drop_duplicates(subset="id", ignore_index=True)
+    return articles_df[mask].drop_duplicates(subset="id", ignore_index=True)
 
 
-# put together separate files with articles
-def merge_pkls(directory):
-    articles = []
+# PARALLEL FILTERING
+# keyword lists and domain of the worker processes, set once per worker by init_filter_worker
+worker_settings = {}
 
-    files = glob.glob(directory+"*")
-    for f in files:
-        if f[-4:]==".pkl":
-            articles.append(pd.read_pickle(f))
-    
-    return pd.concat(articles, ignore_index=True)
+
+def filter_view(articles):
+    """
+    The part of articles that filter_keywords and filter_by_domain read: titles, abstract
+    texts, and only the IDs of concepts and of the domains of topics. Much cheaper to send
+    to another process than the works (inverted indexes above all).
+    """
+    def concept_ids(concepts):
+        return [{"id": c.get("id")} for c in concepts] if isinstance(concepts, list) else None
+
+    def domain(topic):
+        return {"domain": {"id": (topic.get("domain") or {}).get("id")}} if isinstance(topic, dict) else None
+
+    view = pd.DataFrame({
+        "id": articles["id"].to_numpy(),
+        "display_name": articles["display_name"].to_numpy(),
+        "abstract_full_text": abstract_texts(articles).to_numpy(),
+        "concepts": [concept_ids(c) for c in articles["concepts"]],
+    })
+    if "primary_topic" in articles.columns:
+        view["primary_topic"] = [domain(t) for t in articles["primary_topic"]]
+    if "topics" in articles.columns:
+        view["topics"] = [[domain(t) for t in topics] if isinstance(topics, list) else None
+                          for topics in articles["topics"]]
+    return view
+
+
+def init_filter_worker(config, domain_id):
+    """Pool initializer: keep the settings and compile the keyword matchers once per worker."""
+    worker_settings.update(config=config, domain_id=domain_id)
+    build_keyword_matchers(tuple(config["keywords"]["single_word"]), tuple(config["keywords"]["two_word"]))
+
+
+def filter_shard(shard):
+    """
+    Filter one shard (of filter_view) in a worker process.
+
+    Returns:
+        tuple: Positions of the kept works in the shard (np.ndarray) and their
+            matched keywords (list), instead of the works themselves.
+    """
+    shard = shard.assign(row=np.arange(len(shard)))
+    kept = filter_keywords(shard, config=worker_settings["config"], verbose=False)
+    if worker_settings["domain_id"] is not None:
+        kept = filter_by_domain(kept, domain_id=worker_settings["domain_id"])
+    if kept.empty:
+        return np.empty(0, dtype=np.int64), []
+    return kept["row"].to_numpy(dtype=np.int64), kept["matched_keyword"].tolist()
+
+
+class FilterPool:
+    """
+    Keyword (and domain) filter that spreads every batch over a pool of processes.
+
+    A batch is cut into shards of consecutive works. While the workers filter a shard,
+    this process reconstructs the abstracts of the next one. The workers get only what
+    the filters read (filter_view) and send back the positions of the kept works with
+    their matched keyword, so the works themselves never travel. The result is the same
+    as filter_keywords (and filter_by_domain) followed by materialize_abstracts.
+
+    Args:
+        config (dict): Configuration with the keywords and concepts.
+        workers (int): Number of processes (default: all cores).
+        domain_id (str): Domain the works must be in, or None not to check it.
+        shard_size (int): Fewest works per shard; smaller batches go to one worker.
+    """
+
+    def __init__(self, config, workers=None, domain_id=None, shard_size=500):
+        validate_config(config)
+        self.workers = workers or multiprocessing.cpu_count()
+        self.shard_size = shard_size
+        self.pool = multiprocessing.Pool(self.workers, initializer=init_filter_worker,
+                                         initargs=(config, domain_id))
+
+    def __call__(self, articles):
+        if articles.empty:
+            return materialize_abstracts(articles.copy())
+        n_shards = max(1, min(self.workers * 4, len(articles) // self.shard_size))
+        bounds = np.linspace(0, len(articles), n_shards + 1).astype(int)
+
+        shards, results = [], []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            shard = materialize_abstracts(articles.iloc[start:end].reset_index(drop=True))
+            results.append(self.pool.apply_async(filter_shard, (filter_view(shard),)))
+            shards.append(shard)
+
+        kept = []
+        for shard, result in zip(shards, results):
+            rows, keywords = result.get()
+            kept.append(shard.iloc[rows].assign(matched_keyword=keywords))
+        kept = pd.concat(kept, ignore_index=True)
+        return kept.drop_duplicates(subset="id", ignore_index=True)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -11,8 +11,15 @@ countries_path = config_dir / "included_countries.txt"
 with open(countries_path, "r", encoding="utf-8") as file:
     countries = [line.strip() for line in file]
 
+# the fields of an OpenAlex work that get_authors reads; they are part of prep_articles.WORK_FIELDS,
+# so that a harvest that only asks OpenAlex for those fields still downloads them
+AUTHOR_FIELDS = ["id", "publication_date", "authorships"]
+
 # get authorship information from raw dataframe WITH all other data
 def get_authors(df_input): # input: articles after get_dict_info
+    missing = [field for field in AUTHOR_FIELDS if field not in df_input.columns]
+    if missing:
+        raise ValueError(f"Articles lack the fields {missing}: are they in prep_articles.WORK_FIELDS?")
     # create empty dataframe with all authorship attributes
     df = pd.DataFrame()
     authors_list = []
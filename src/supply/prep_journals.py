@@ -28,8 +28,27 @@ from_date = config.get("from_date", "2014-01-01")  # Default to 2014-01-01 if no
 from_date_year = datetime.strptime(from_date, "%Y-%m-%d").year-1
 
 # wikidata objects of countries often have a ISO 3166-1 alpha-2 code (P297): 
-# use this unambiguous code instead of the wikidata ID, just like OpenALex
-def get_country_codes():
+# use this unambiguous code instead of the wikidata ID, just like OpenALex.
+# data/external/country_codes.tsv has no Wikidata items, so the first run always queries WDQS;
+# the resulting lookup table is kept in data/interim and only asked from Wikidata again on demand.
+# Bump COUNTRY_TABLE_VERSION when its columns change.
+COUNTRY_TABLE_VERSION = 1
+root_dir = Path(__file__).resolve().parents[2]
+country_seed_path = root_dir / "data" / "external" / "country_codes.tsv"
+country_table_path = root_dir / "data" / "interim" / f"country_codes_wikidata_v{COUNTRY_TABLE_VERSION}.tsv"
+
+def refresh_country_codes():
+    """
+    Rebuild the country lookup table: every country of data/external/country_codes.tsv
+    (name and two-letter code), with the Wikidata items that have that two-letter code.
+
+    Returns:
+        pd.DataFrame: Columns item, alpha2, name and refreshed (date of the Wikidata query).
+    """
+    # "NA" is Namibia, not a missing value
+    seed = pd.read_csv(country_seed_path, sep="\t", keep_default_na=False)
+    seed = seed.rename(columns={"Country": "name", "Alpha-2 code": "alpha2"})[["name", "alpha2"]]
+
     query = """SELECT DISTINCT ?item ?itemLabel ?twoLetterCode WHERE {
   ?item wdt:P297 ?twoLetterCode
   SERVICE wikibase:label { bd:serviceParam wikibase:language "[AUTO_LANGUAGE]". }
@@ -43,55 +62,76 @@ def get_country_codes():
   }
 }"""
     results = download.get_sparql_results(query)
-    
-    countries = {}
-    for country in results.itertuples():
-        try:
-            countries[country.item["value"]] = country.twoLetterCode["value"]
-        except KeyError as e:
-            print(f"KeyError while processing country data: {e}")
-    return countries
+    if results.empty:
+        print("Country codes could not be retrieved from Wikidata.")
+        return None
+
+    wikidata = pd.DataFrame({"item": results["item"].str.get("value"),
+                             "alpha2": results["twoLetterCode"].str.get("value")})
+    table = seed.merge(wikidata, on="alpha2", how="outer")
+    table["item"] = table["item"].fillna("")
+    table["name"] = table["name"].fillna("")
+    table["refreshed"] = datetime.now().strftime("%Y-%m-%d")
+
+    country_table_path.parent.mkdir(parents=True, exist_ok=True)
+    table[["item", "alpha2", "name", "refreshed"]].to_csv(country_table_path, sep="\t", index=False)
+    return table
+
+def get_country_codes(refresh=False):
+    """
+    Look up the two-letter code of Wikidata country items.
+
+    Args:
+        refresh (bool): Query Wikidata again, even if a lookup table was saved before.
+
+    Returns:
+        pd.Series: Two-letter codes, indexed by Wikidata item URL.
+    """
+    table = None
+    if not refresh and country_table_path.exists():
+        table = pd.read_csv(country_table_path, sep="\t", keep_default_na=False)
+    if table is None:
+        table = refresh_country_codes()
+    if table is None and country_table_path.exists():
+        print("Using the country codes saved before.")
+        table = pd.read_csv(country_table_path, sep="\t", keep_default_na=False)
+    if table is None:
+        return pd.Series(dtype=object)
+
+    table = table[table["item"] != ""].drop_duplicates(subset="item")
+    return pd.Series(table["alpha2"].values, index=table["item"].values)
+
+def unwrap_values(column):
+    """Get the values out of the dictionaries of a Wikidata result column (None where missing)."""
+    if column.dtype != object: # nothing but missing values
+        return pd.Series(None, index=column.index, dtype=object)
+    return column.str.get("value")
 
 # Wikidata query results are tables with most values locked in dictionaries: get them out 
-def get_values_wikidata(df):
+def get_values_wikidata(df, countries=None):
     # get two-letter country code for every country
-    countries = get_country_codes()
+    if countries is None:
+        countries = get_country_codes()
     # replace every column with the values locked inside it
     for column in df.columns:
-        values = []
-        for x in df[column]:
-            # first some exceptions:
-            if column == "dissolved":
-                if x==x: # if there is a "dissolved" value,
-                    # get only the year of dissolvement, not entire date
-                    values.append(x["value"][:4])
-                else:
-                    values.append(None)
-            
-            elif column == "openAlexID":
-                if x==x: # update OpenAlexID from their old "venue" IDs to new "source" IDs
-                    # e.g. V123 becomes S123
-                    values.append("S"+x["value"][1:])
-                else:
-                    values.append(None)
-                    
-            elif column == "country":
-                if x==x and x["value"] in countries: # replace country with two-letter code
-                    values.append(countries[x["value"]])
-                else:
-                    values.append(None)
-            
-            elif column == "source":
-                values = df.source 
-                
-            # for most columns: just get the value out of the dictionary
-            elif x==x:
-                values.append(x["value"])
-            else:
-                values.append(None)
-                
+        if column == "source":
+            continue
+        values = unwrap_values(df[column])
+
+        # first some exceptions:
+        if column == "dissolved":
+            # get only the year of dissolvement, not entire date
+            values = values.str[:4]
+        elif column == "openAlexID":
+            # update OpenAlexID from their old "venue" IDs to new "source" IDs
+            # e.g. V123 becomes S123
+            values = "S" + values.str[1:]
+        elif column == "country":
+            # replace country with two-letter code
+            values = values.map(countries)
+
         # replace old column with its true values
-        df[column] = values
+        df[column] = values.astype(object).where(values.notna(), None)
         
 
 # homogenize OpenAlex table with Wikidata tables
@@ -1,7 +1,10 @@
 import pandas as pd
 import numpy as np
-import re
-from pathlib import Path 
+import multiprocessing
+import tempfile
+# custom packages
+import gbif_backbone
+import name_scanner
 
 # openAlex gives only inverted index of the abstract 
 # the: 1, 12, 14; quick: 2, 10, 51; brown: 3; dog: 4, 15; ...
@@ -16,47 +19,27 @@ def inverted_index_to_text(aii):
     Returns:
         str: Full abstract string reconstructed from index.
     """
-    abstract = 50000 * [None,]
+    # one slot per position, up to the last one: no limit on the length of an abstract
+    # (for a repeated position, the last word wins)
+    length = max((max(indices) + 1 for indices in aii.values() if indices), default=0)
+    abstract = [None] * length
 
     for word, indices in aii.items():
         for i in indices:
             # put each word in the inverted index in its place in the abstract
-            abstract[i] =  word
+            abstract[i] = word
     
-    # from list to text 
-    abstract = [j for j in abstract if j is not None]
-    abstract = " ".join(abstract)
-    return abstract
+    # from positions to text 
+    return " ".join([word for word in abstract if word is not None])
 
 
 # reduce size of backbone for easier searching
 def preprocess_backbone(path=None, no_blanks=False):
-    if path is None:
-        this_dir = Path(__file__).resolve().parent
-        root_dir = this_dir.parents[1]
-        path = root_dir / "data" / "external" / "backbone" / "Taxon.tsv"
-    # GBIF taxonomic bakcbone
-    # backbone = pd.read_csv(path, sep="\t", on_bad_lines='skip')
-    backbone = pd.read_csv(path, sep="\t", 
-                       dtype={'scientificNameAuthorship': 'str', 
-                              'infraspecificEpithet': 'str',
-                              'canonicalName': 'str',
-                              'genericName': 'str',
-                              'specificEpithet': 'str',
-                              'namePublishedIn': 'str',
-                              'taxonomicStatus': 'str',
-                              'taxonRank': 'str',
-                              'taxonRemarks': 'str',
-                              'kingdom': 'str',
-                              'phylum': 'str',
-                              'family': 'str',
-                              'genus': 'str'},
-                       on_bad_lines='skip')
-
+    # GBIF taxonomic backbone, compiled once from Taxon.tsv (gbif_backbone.py)
     # only Eukarya
-    backbone = backbone[(backbone["kingdom"]=="Animalia") | 
-                        (backbone["kingdom"]=="Plantae") |
-                        (backbone["kingdom"]=="Fungi")]
+    kwargs = {} if path is None else {"taxon_path": path}
+    backbone = gbif_backbone.load_backbone(filters=[("kingdom", "in", ["Animalia", "Plantae", "Fungi"])],
+                                           **kwargs)
     # include non-accepted species (synonyms etc), but not blank canonical names 
     backbone = backbone[np.logical_not(backbone["canonicalName"].isnull())].reset_index(drop=True)
     
@@ -73,63 +56,67 @@ def preprocess_backbone(path=None, no_blanks=False):
 
 
 # look for canonical species names in article titles and abstracts
-def parse_for_taxonomy(articles, backbone):
-    all_names = set(backbone["canonicalName"])
-    all_found_taxa = []
-    
-    for article in articles[["id", "title", "abstract_full_text"]].itertuples():
-        found = False
-        taxa_list = []
-
-        # IN TITLE
-        # find full species name
-        if article.title:
-            candidates = re.findall("[A-Z][a-z]+ [a-z]+", article.title) # anything that looks like "Abcd efg"
-            for candidate in candidates:
-                # check if Abcd efg matches a known species name
-                if candidate not in taxa_list and candidate in all_names:
-                    taxa_list.append(candidate); found = True
-
-        if found:
-            all_found_taxa.append(taxa_list)
-            # find "G. species"
-            for taxon in taxa_list:
-                # search for first letter of already found genus + probable species name
-                #candidates = re.findall(taxon[0]+"\. [a-z]+", article.title)
-                candidates = re.findall(rf"{taxon[0]}\. [a-z]+", article.title)
-
-                for candidate in candidates:
-                    candidate = taxon.split()[0] + " " + candidate[3:]
-                    # check if string is a species
-                    if candidate not in taxa_list and candidate in all_names:
-                        taxa_list.append(candidate)
-            # do not check abstract if title has results
-            continue
-
-        # IN ABSTRACT
-        # find full species name
-        if article.abstract_full_text:
-            candidates = re.findall("[A-Z][a-z]+ [a-z]+", article.abstract_full_text) 
-            for candidate in candidates:
-                if candidate not in taxa_list and candidate in all_names:
-                    taxa_list.append(candidate); found = True
-
-        # find "G. species"
-        if found:
-            for taxon in taxa_list:
-                # search for first letter of already found genus + probable species name 
-                #candidates.extend(re.findall(taxon[0]+"\. [a-z]+", article.abstract_full_text))
-                candidates.extend(re.findall(rf"{taxon[0]}\. [a-z]+", article.abstract_full_text))
-
-                for candidate in candidates:
-                    candidate = taxon.split()[0] + " " + candidate[3:]
-                    # check if string is a species
-                    if candidate not in taxa_list and candidate in all_names:
-                        taxa_list.append(candidate); found = True
-
-        all_found_taxa.append(taxa_list)
-
-    articles["species_subject"] = all_found_taxa 
+def find_taxa(scanner, title, abstract):
+    """
+    Names of the backbone in the title of an article, or else in its abstract
+    (the abstract is not checked if the title has results).
+    """
+    taxa = scanner.scan(title) if isinstance(title, str) and title else []
+    if not taxa and isinstance(abstract, str) and abstract:
+        taxa = scanner.scan(abstract)
+    return taxa
+
+
+# species detection in a pool of processes, set up once per worker by init_scan_worker
+scan_settings = {}
+
+
+def init_scan_worker(index_dir, genera):
+    """Pool initializer: a scanner over the memory-mapped name index, shared by all workers."""
+    scan_settings["scanner"] = name_scanner.NameScanner(name_scanner.NameIndex.load(index_dir), genera)
+
+
+def scan_shard(texts):
+    """Found taxa of every (title, abstract) of a shard, in a worker process."""
+    scanner = scan_settings["scanner"]
+    return [find_taxa(scanner, title, abstract) for title, abstract in texts]
+
+
+def parse_for_taxonomy(articles, backbone, workers=1, shard_size=2000):
+    """
+    Add the species (and infraspecific taxa) named in every article as species_subject.
+
+    Titles and abstracts are scanned in one pass each by a name_scanner.NameScanner built
+    from the backbone: binomials and trinomials, hyphenated epithets, and abbreviations
+    like "G. species" of a genus named in the same text.
+
+    With more than one worker, the articles are cut into shards of consecutive titles and
+    abstracts, scanned by a pool of processes and put back in order. The names are then
+    written once as a name_scanner.NameIndex to a temporary folder that every worker maps
+    into memory, instead of each getting a copy of a set of millions of names; only the
+    (far fewer) genera are sent to every worker.
+
+    Args:
+        workers (int): Number of processes (None: all cores; 1: scan in this process).
+        shard_size (int): Articles per shard sent to a worker.
+    """
+    texts = zip(articles["title"], articles["abstract_full_text"])
+    workers = workers or multiprocessing.cpu_count()
+    if workers == 1:
+        scanner = name_scanner.NameScanner.from_backbone(backbone)
+        articles["species_subject"] = [find_taxa(scanner, title, abstract) for title, abstract in texts]
+        return articles
+
+    texts = list(texts)
+    shards = [texts[start:start + shard_size] for start in range(0, len(texts), shard_size)]
+    names = backbone["canonicalName"].dropna().unique()
+    with tempfile.TemporaryDirectory() as index_dir:
+        name_scanner.NameIndex.from_names(names).save(index_dir)
+        with multiprocessing.Pool(workers, initializer=init_scan_worker,
+                                  initargs=(index_dir, name_scanner.first_words(names))) as pool:
+            # imap returns the shards in order
+            found = [taxa for shard in pool.imap(scan_shard, shards) for taxa in shard]
+    articles["species_subject"] = found
     return articles
 
 
@@ -0,0 +1,56 @@
+# apply changed keywords or concepts (config.json) to the articles harvested before,
+# using the raw store and postings index kept by get_articles.py instead of a new harvest
+import pandas as pd
+import json
+from pathlib import Path
+# custom packages
+import prep_articles
+import work_index
+import article_store
+
+# === Path setup ===
+this_dir = Path(__file__).resolve().parent
+root_dir = this_dir.parents[1]
+
+config_path = root_dir / "config" / "config.json"
+interim_dir = root_dir / "data" / "interim" / "keyword-filtered_articles"
+store_dir = root_dir / "data" / "interim" / "raw_works"
+
+# === Load configuration ===
+if not config_path.exists():
+    raise FileNotFoundError(f"Config file not found at {config_path}")
+
+with open(config_path, "r", encoding="utf-8") as config_file:
+    config = json.load(config_file)
+
+index = work_index.WorkIndex(store_dir)
+if not len(index):
+    raise FileNotFoundError(f"No harvested works in {store_dir}: run get_articles.py first")
+
+# articles that passed the filters before are flattened and passed the domain filter already:
+# they only need to be checked against the new keywords and concepts
+store_path = interim_dir / "filtered_articles.pkl"
+filtered_store = article_store.ArticleStore(interim_dir / "filtered_articles")
+if not filtered_store.is_empty():
+    known = filtered_store.read()
+else:
+    known = pd.read_pickle(store_path) if store_path.exists() else pd.DataFrame()
+kept = prep_articles.filter_keywords(known, config=config)
+
+# only the works that may newly match are read back from the raw store
+new = prep_articles.filter_keywords_indexed(index, config=config,
+                                            exclude_ids=set(known["id"]) if not known.empty else ())
+new = prep_articles.filter_by_domain(new, domain_id="https://openalex.org/domains/1")
+if not new.empty:
+    new = prep_articles.flatten_works(new)
+
+articles = prep_articles.materialize_abstracts(pd.concat([kept, new], ignore_index=True))
+print(f"Kept {len(kept)} of {len(known)} filtered articles, added {len(new)} newly matching articles")
+
+# save final version of all (European) keyword-filtered taxonomic articles together
+filtered_store.reset()
+filtered_store.append(articles)
+articles.to_pickle(store_path)
+articles.to_csv(interim_dir / "filtered_articles.tsv", sep="\t")
+
+print("Taxonomic articles filtered again. Results in data/interim/filtered_articles.tsv.")
@@ -0,0 +1,216 @@
+# RAW STORE OF HARVESTED WORKS WITH A POSTINGS INDEX OF THEIR TERMS
+"""
+Keeps every harvested work, so that a change of keywords or concepts in
+config.json does not need a new harvest.
+
+The works are written as gzipped JSON-lines shards (download.JsonlShardWriter).
+Next to them, a postings index maps every term to the works containing it. The
+terms are the normalized words of the title and the abstract (the keys of
+`abstract_inverted_index`) and the concept IDs ("concept:<id>"). A keyword can
+only match works that contain every one of its words, possibly as part of a
+longer term. So the index finds a small superset of the matching works, and
+only these need to be read back and checked by prep_articles.filter_keywords.
+
+Files in the store directory:
+- works00000.jsonl.gz, ...: the works, in order of harvest;
+- index.json.gz: work ID of every document and all terms;
+- index.npz: shard and line of every document, and the postings of all terms
+  as one array of document numbers (with the offsets of every term).
+"""
+import gzip
+import json
+import re
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+import download
+from prep_articles import normalize_text
+
+
+def work_terms(work):
+    """Index terms of a work: words of its normalized title and abstract, and its concept IDs."""
+    title = work.get("display_name")
+    terms = set(normalize_text(title).split()) if isinstance(title, str) else set()
+    abstract = work.get("abstract_inverted_index")
+    if isinstance(abstract, dict):
+        for key in abstract:
+            terms.update(normalize_text(key).split())
+    concepts = work.get("concepts")
+    if isinstance(concepts, list):
+        terms.update("concept:" + c["id"] for c in concepts if c.get("id"))
+    return terms
+
+
+class WorkIndex:
+    """
+    Raw works with a postings index of their terms.
+
+    Call with every page (list) of works, then
+    `save()`. A work that is added again (updated in an incremental harvest)
+    replaces its earlier version.
+
+    Args:
+        directory (str or Path): Folder of the shards and index files.
+        shard_size (int): Works per shard.
+    """
+
+    def __init__(self, directory, shard_size=10000):
+        self.directory = Path(directory)
+        self.shard_size = shard_size
+        self.json_path = self.directory / "index.json.gz"
+        self.npz_path = self.directory / "index.npz"
+        self.clear()
+        self.load()
+
+    def clear(self):
+        self.works = []            # document -> work ID
+        self.shards = array("I")   # document -> shard
+        self.lines = array("I")    # document -> line in the shard
+        self.latest = {}           # work ID -> document of its latest version
+        self.terms = []            # term number -> term
+        self.term_numbers = {}
+        self.offsets = np.zeros(1, dtype=np.int64)   # saved postings of every term
+        self.postings = np.zeros(0, dtype=np.uint32)
+        self.added = {}            # term number -> documents added since loading
+        self.n_shards = 0
+        self.writer = None
+        self.vocabulary = None
+
+    def load(self):
+        if not (self.json_path.exists() and self.npz_path.exists()):
+            return
+        with gzip.open(self.json_path, "rt", encoding="utf-8") as f:
+            saved = json.load(f)
+        self.works = saved["works"]
+        self.terms = saved["terms"]
+        self.n_shards = saved["n_shards"]
+        self.term_numbers = {term: number for number, term in enumerate(self.terms)}
+        self.latest = {work_id: doc for doc, work_id in enumerate(self.works)}
+        with np.load(self.npz_path) as arrays:
+            self.shards = array("I", arrays["shards"].tolist())
+            self.lines = array("I", arrays["lines"].tolist())
+            self.offsets = arrays["offsets"]
+            self.postings = arrays["postings"]
+
+    def reset(self):
+        """Delete all stored works and the index."""
+        self.close()
+        for f in self.directory.glob("works*.jsonl.gz"):
+            f.unlink()
+        self.json_path.unlink(missing_ok=True)
+        self.npz_path.unlink(missing_ok=True)
+        self.clear()
+
+    def __len__(self):
+        return len(self.latest)
+
+    def __call__(self, page):
+        if self.writer is None:
+            self.writer = download.JsonlShardWriter(self.directory, shard_size=self.shard_size,
+                                                    first_shard=self.n_shards)
+        for work in page:
+            doc = len(self.works)
+            self.works.append(work["id"])
+            self.shards.append(self.writer.shard)
+            self.lines.append(self.writer.in_shard)
+            self.writer([work])
+            self.latest[work["id"]] = doc
+            for term in work_terms(work):
+                number = self.term_numbers.get(term)
+                if number is None:
+                    number = self.term_numbers[term] = len(self.terms)
+                    self.terms.append(term)
+                    self.vocabulary = None
+                self.added.setdefault(number, array("I")).append(doc)
+
+    def close(self):
+        """Close the shard being written; works added later go into a new shard."""
+        if self.writer is not None:
+            self.writer.close()
+            self.n_shards = self.writer.shard + (self.writer.in_shard > 0)
+            self.writer = None
+
+    def save(self):
+        """Close the shards and write the index."""
+        self.close()
+        merged = [self.term_postings(number) for number in range(len(self.terms))]
+        self.offsets = np.concatenate([[0], np.cumsum([len(docs) for docs in merged], dtype=np.int64)]).astype(np.int64)
+        self.postings = np.concatenate(merged).astype(np.uint32) if merged else np.zeros(0, dtype=np.uint32)
+        self.added = {}
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with gzip.open(self.json_path, "wt", encoding="utf-8") as f:
+            json.dump({"works": self.works, "terms": self.terms, "n_shards": self.n_shards}, f)
+        with open(self.npz_path, "wb") as f:
+            np.savez_compressed(f, shards=np.frombuffer(self.shards, dtype=np.uint32),
+                                lines=np.frombuffer(self.lines, dtype=np.uint32),
+                                offsets=self.offsets, postings=self.postings)
+
+    def term_postings(self, number):
+        """Documents containing a term, by term number."""
+        docs = []
+        if number + 1 < len(self.offsets):
+            docs.append(self.postings[self.offsets[number]:self.offsets[number + 1]])
+        if number in self.added:
+            docs.append(np.frombuffer(self.added[number], dtype=np.uint32))
+        return np.concatenate(docs) if docs else np.zeros(0, dtype=np.uint32)
+
+    def docs_with(self, word):
+        """Documents with a term that contains word."""
+        if self.vocabulary is None:
+            # all terms in one string, so that a substring search over the vocabulary runs in C
+            self.vocabulary = "\n".join(self.terms)
+            lengths = np.fromiter((len(term) + 1 for term in self.terms), dtype=np.int64, count=len(self.terms))
+            self.term_starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        positions = [m.start() for m in re.finditer(re.escape(word), self.vocabulary)]
+        numbers = np.unique(np.searchsorted(self.term_starts, positions, side="right") - 1)
+        if len(numbers) == 0:
+            return np.zeros(0, dtype=np.uint32)
+        return np.unique(np.concatenate([self.term_postings(n) for n in numbers]))
+
+    def candidates(self, keywords, concepts=()):
+        """
+        IDs of the works that may match: those containing every word of a keyword
+        (normalized like filter_keywords does), or one of the concepts.
+        """
+        found = []
+        docs_by_word = {}
+        for keyword in keywords:
+            words = normalize_text(keyword).split()
+            if not words:
+                continue
+            docs = None
+            for word in words:
+                if word not in docs_by_word:
+                    docs_by_word[word] = self.docs_with(word)
+                docs = docs_by_word[word] if docs is None else np.intersect1d(docs, docs_by_word[word], assume_unique=True)
+            found.append(docs)
+        for concept in concepts:
+            number = self.term_numbers.get("concept:" + concept)
+            if number is not None:
+                found.append(self.term_postings(number))
+        if not found:
+            return []
+        docs = np.unique(np.concatenate(found))
+        # only the latest version of every work counts
+        return [self.works[doc] for doc in docs.tolist() if self.latest[self.works[doc]] == doc]
+
+    def fetch(self, work_ids):
+        """The stored (latest) versions of these works, in order of harvest. Only reads saved shards."""
+        locations = sorted((self.shards[doc], self.lines[doc]) for doc in (self.latest[i] for i in work_ids))
+        works = []
+        i = 0
+        while i < len(locations):
+            shard = locations[i][0]
+            wanted = set()
+            while i < len(locations) and locations[i][0] == shard:
+                wanted.add(locations[i][1])
+                i += 1
+            path = self.directory / f"works{shard:05d}.jsonl.gz"
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line_number, line in enumerate(f):
+                    if line_number in wanted:
+                        works.append(json.loads(line))
+        return works
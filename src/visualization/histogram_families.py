@@ -10,7 +10,8 @@ root_dir = this_file.parents[2]
 
 # Paths to input and output
 articles_path = root_dir / "data" / "processed" / "taxonomic_articles_with_subjects.pkl"
-backbone_path = root_dir / "data" / "external" / "backbone" / "Taxon.tsv"
+# GBIF backbone compiled from Taxon.tsv by src/supply/gbif_backbone.py
+backbone_path = root_dir / "data" / "interim" / "backbone" / "backbone.parquet"
 figures_dir = root_dir / "reports" / "figures"
 figures_dir.mkdir(parents=True, exist_ok=True)
 
@@ -25,10 +26,10 @@ articles = pd.read_pickle(articles_path)
 
 # Check if backbone file exists
 if not backbone_path.exists():
-    raise FileNotFoundError(f"The file {backbone_path} does not exist. Please check the path.")
+    raise FileNotFoundError(f"The file {backbone_path} does not exist. Run src/supply/gbif_backbone.py first.")
 
-# Load and filter backbone
-backbone = pd.read_csv(backbone_path, sep="\t", on_bad_lines='skip', low_memory=False)
+# Load and filter backbone (only the columns used here)
+backbone = pd.read_parquet(backbone_path, columns=["canonicalName", "taxonomicStatus", "family"])
 backbone = backbone[backbone["taxonomicStatus"] != "doubtful"]
 backbone = backbone[["canonicalName", "family"]].dropna().drop_duplicates(ignore_index=True)
 
@@ -12,11 +12,12 @@ data_dir = root_dir / "data"
 figures_dir = root_dir / "reports" / "figures"
 figures_dir.mkdir(parents=True, exist_ok=True)
 
-articles_path = data_dir / "processed" / "taxonomic_articles_with_subjects.pkl"
+# Parquet store written by parse_taxonomy.py, partitioned by journal and year
+articles_path = data_dir / "processed" / "taxonomic_articles"
 
 # ── LOAD DATA ──────────────────────────────────────────────
 print("Processing input data...")
-articles = pd.read_pickle(articles_path)
+articles = pd.read_parquet(articles_path, columns=["source_id", "oa_oa_status"])
 
 # ── AGGREGATE OPEN ACCESS STATUSES ─────────────────────────
 data_plot = pd.DataFrame()
@@ -4,6 +4,7 @@ from wordcloud import WordCloud, STOPWORDS
 import pandas as pd
 import matplotlib.pyplot as plt
 import re
+from collections import Counter
 from pathlib import Path
 
 # ── PATH SETUP ───────────────────────────────────────────────────
@@ -34,18 +35,17 @@ def clean_word(word):
     return re.sub(r"[^\w\s]", "", word).lower()
 
 def wordcloud_abstracts(df, name):
-    abstract_words = df["abstract_inverted_index"]
-    abstract_words = list(filter(None, abstract_words))
-    num_articles = len(abstract_words)
+    abstract_texts = [text for text in df["abstract_full_text"] if isinstance(text, str) and text]
+    num_articles = len(abstract_texts)
 
     frequencies = {}
-    for pub in abstract_words:
-        for word, indices in pub.items():
+    for pub in abstract_texts:
+        for word, count in Counter(pub.split()).items():
             word = clean_word(word)
             if word in frequencies:
-                frequencies[word] += len(indices)
+                frequencies[word] += count
             elif word.lower() not in stopwords:
-                frequencies[word] = len(indices)
+                frequencies[word] = count
 
     wordcloud = WordCloud(
         stopwords=stopwords,
@@ -0,0 +1,57 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "supply"))
+import article_store  # noqa: E402
+
+
+def works(ids, **columns):
+    return pd.DataFrame({"id": ids, "publication_date": ["2020-01-01"] * len(ids),
+                         "source_id": ["https://openalex.org/S1"] * len(ids), **columns})
+
+
+def test_column_missing_from_first_batch_takes_text_later(tmp_path):
+    store = article_store.ArticleStore(tmp_path)
+    store.append(works(["W1"]))
+    store.append(works(["W2"], lic=["cc-by"]))
+    articles = store.read(columns=["id", "lic"]).set_index("id")["lic"]
+    assert pd.isna(articles["W1"]) and articles["W2"] == "cc-by"
+
+
+def test_all_missing_column_is_not_frozen(tmp_path):
+    store = article_store.ArticleStore(tmp_path)
+    store.append(works(["W1", "W2"], lic=[float("nan")] * 2, extra=[None, None]))
+    store.append(works(["W3"], lic=["cc-by"], extra=[{"a": [1, 2]}]))
+    articles = store.read(columns=["id", "lic", "extra"]).set_index("id")
+    assert articles.loc["W3", "lic"] == "cc-by"
+    assert articles.loc["W3", "extra"] == {"a": [1, 2]}
+    assert articles.loc["W1", "extra"] is None
+
+
+def test_numbers_widen_to_json(tmp_path):
+    store = article_store.ArticleStore(tmp_path)
+    store.append(works(["W1"], score=[1]))
+    store.append(works(["W2"], score=[2.5]))
+    store.append(works(["W3"], score=["high"]))
+    store = article_store.ArticleStore(tmp_path)  # encodings as recorded in _columns.json
+    articles = store.read(columns=["id", "score"]).set_index("id")["score"]
+    assert articles.to_dict() == {"W1": 1, "W2": 2.5, "W3": "high"}
+
+
+def test_declared_columns_keep_their_encoding(tmp_path):
+    store = article_store.ArticleStore(tmp_path)
+    store.append(works(["W1"], source_is_oa=[True], source_issn=[None]))
+    store.append(works(["W2"], source_is_oa=["unknown"], source_issn=["1234-5678"]))
+    articles = store.read(columns=["id", "source_is_oa", "source_issn"]).set_index("id")
+    assert articles.loc["W1", "source_is_oa"] is True and articles.loc["W2", "source_is_oa"] == "unknown"
+    assert articles.loc["W2", "source_issn"] == "1234-5678"
+
+
+def test_nested_values_in_text_column_are_refused(tmp_path):
+    store = article_store.ArticleStore(tmp_path)
+    store.append(works(["W1"], note=["text"]))
+    with pytest.raises(ValueError, match="note"):
+        store.append(works(["W2"], note=[{"nested": True}]))
@@ -0,0 +1,60 @@
+import re
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "supply"))
+import keyword_matcher  # noqa: E402
+
+SINGLE_WORDS = ["taxonomic", "taxon", "nov."]
+TWO_WORDS = ["new species", "new genus", "novel species"]
+
+
+def former_pattern(single_words, two_words):
+    """The abstract regex of filter_keywords before the Aho-Corasick matcher."""
+    two_word_patterns = [
+        rf"\b{re.escape(w.split()[0])}\b(?:\s+\S+)?\s+\b{re.escape(w.split()[1])}\b"
+        for w in two_words if len(w.split()) == 2
+    ]
+    return re.compile("|".join(two_word_patterns + [re.escape(k) for k in single_words]))
+
+
+@pytest.fixture(params=["installed", "python"])
+def matcher(request, monkeypatch):
+    """The abstract matcher, with pyahocorasick if it is installed and with the pure-Python automaton."""
+    if request.param == "installed" and keyword_matcher.ahocorasick is None:
+        pytest.skip("pyahocorasick is not installed")
+    if request.param == "python":
+        monkeypatch.setattr(keyword_matcher, "ahocorasick", None)
+    return keyword_matcher.KeywordMatcher(SINGLE_WORDS, word_pairs=[w.split() for w in TWO_WORDS])
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("a new species of beetle", "new species"),
+    ("a new interesting species of beetle", "new species"),
+    ("a new, very interesting species", None),   # two words in between
+    ("renew species lists", None),               # not a whole first word
+    ("new speciesgroups", None),                 # not a whole second word
+    ("new-species", None),                       # no whitespace in the gap
+    ("new\n\tgenus", "new genus"),
+])
+def test_word_pair_gap(matcher, text, expected):
+    assert matcher.first_match(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "description of a new species from belgium",
+    "a taxonomic revision of the genus",
+    "taxonomy of the family",                    # "taxon" anywhere, like `in`
+    "sp. nov. from the alps",
+    "new to science: one species",
+    "a novel and rare species",
+    "new new species",
+    "species new to the fauna",
+    "no keyword here",
+    "",
+])
+def test_same_result_as_former_regex(matcher, text):
+    pattern = former_pattern(SINGLE_WORDS, TWO_WORDS)
+    assert (matcher.first_match(text) is not None) == bool(pattern.search(text))
@@ -0,0 +1,49 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "supply"))
+import name_scanner  # noqa: E402
+
+NAMES = ["Picea abies", "Pinus abies", "Abies alba", "Pinus sylvestris", "Pinus nigra",
+         "Pinus nigra laricio", "Capsella bursa-pastoris", "Anopheles gambiae", "Pinus"]
+
+
+@pytest.fixture(params=["set", "index"])
+def scanner(request, tmp_path):
+    """A scanner over a set of names, and over a NameIndex saved and memory-mapped like the workers use it."""
+    if request.param == "set":
+        return name_scanner.NameScanner(set(NAMES))
+    name_scanner.NameIndex.from_names(NAMES).save(tmp_path)
+    return name_scanner.NameScanner(name_scanner.NameIndex.load(tmp_path), name_scanner.first_words(NAMES))
+
+
+def test_trinomial_is_preferred(scanner):
+    assert scanner.scan("Stands of Pinus nigra laricio in Corsica") == ["Pinus nigra laricio"]
+    # without a known trinomial, the binomial is found
+    assert scanner.scan("Stands of Pinus nigra salzmannii in Spain") == ["Pinus nigra"]
+    assert scanner.scan("Pinus sylvestris forests") == ["Pinus sylvestris"]
+
+
+def test_hyphenated_names(scanner):
+    assert scanner.scan("Seeds of Capsella bursa-pastoris germinate") == ["Capsella bursa-pastoris"]
+    # a suffix such as -complex falls back on the species
+    assert scanner.scan("the Anopheles gambiae-complex in Africa") == ["Anopheles gambiae"]
+
+
+def test_abbreviation_resolved_against_earlier_genera(scanner):
+    text = "Picea abies and Pinus sylvestris were planted. P. abies grew faster than P. nigra."
+    # "P." is resolved against the most recent genus with that initial that makes a name
+    assert scanner.scan(text) == ["Picea abies", "Pinus sylvestris", "Pinus abies", "Pinus nigra"]
+
+
+def test_abbreviation_needs_a_named_genus(scanner):
+    assert scanner.scan("A. alba is common; P. nigra is not named in full") == []
+    # an abbreviation before its genus is resolved at the end of the text
+    assert scanner.scan("A. alba, here called Abies alba") == ["Abies alba"]
+
+
+def test_each_name_once_and_no_genera_or_sentence_starts(scanner):
+    text = "The Pinus genus. Pinus nigra, Pinus nigra and The results of Pinus nigra"
+    assert scanner.scan(text) == ["Pinus nigra"]
@@ -0,0 +1,76 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "supply"))
+import prep_articles  # noqa: E402
+import work_index  # noqa: E402
+
+CONFIG = {"from_date": "2014-01-01", "to_date": None, "concepts": ["https://openalex.org/C58642233"],
+          "keywords": {"single_word": ["taxonomic", "nov."], "two_word": ["new species"]}}
+
+
+def work(work_id, title, abstract="", concepts=()):
+    index = {}
+    for position, word in enumerate(abstract.split()):
+        index.setdefault(word, []).append(position)
+    return {"id": work_id, "display_name": title, "abstract_inverted_index": index or None,
+            "concepts": [{"id": c} for c in concepts]}
+
+
+WORKS = [
+    work("W1", "A taxonomic revision of Abies"),
+    work("W2", "Pollination ecology", "we describe a new species of bee"),
+    work("W3", "Pollination ecology", "a new rare species"),                    # one word in between
+    work("W4", "Pollination ecology", "new to science, one species"),       # candidate, no match
+    work("W5", "Soil bacteria", "", concepts=["https://openalex.org/C58642233"]),
+    work("W6", "Soil bacteria", "Nematoda gen. nov. from Belgium"),
+    work("W7", "Climate and crops", "no keyword at all"),
+    work("W8", "Taxonomical notes"),                                      # "taxonomic" inside a word
+]
+# an incremental harvest brings new versions of W1 (no longer matching) and W7 (now matching)
+UPDATES = [work("W1", "A revision of Abies"), work("W7", "Climate and crops", "a new species of wheat rust")]
+
+
+def expected_ids(works):
+    """IDs that filter_keywords keeps from the latest version of every work."""
+    latest = {w["id"]: w for w in works}
+    kept = prep_articles.filter_keywords(pd.DataFrame(list(latest.values())), config=CONFIG, verbose=False)
+    return set(kept["id"])
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = work_index.WorkIndex(tmp_path, shard_size=3)
+    index(WORKS[:5])
+    index(WORKS[5:])
+    index.save()
+    index = work_index.WorkIndex(tmp_path, shard_size=3)  # saved postings
+    index(UPDATES)                                         # and postings added since loading
+    index.save()
+    return work_index.WorkIndex(tmp_path, shard_size=3)
+
+
+def test_candidates_are_a_superset_of_the_matches(index):
+    keywords = CONFIG["keywords"]["single_word"] + CONFIG["keywords"]["two_word"]
+    candidates = set(index.candidates(keywords, CONFIG["concepts"]))
+    assert expected_ids(WORKS + UPDATES) <= candidates
+    assert "W4" in candidates                  # both words of "new species", however far apart
+    assert "W1" not in candidates              # its latest version has no keyword
+
+
+def test_fetch_returns_the_latest_versions(index):
+    fetched = {w["id"]: w for w in index.fetch(["W7", "W1", "W2"])}
+    assert fetched["W1"]["display_name"] == "A revision of Abies"
+    assert fetched["W7"] == UPDATES[1] and fetched["W2"] == WORKS[1]
+
+
+def test_refilter_matches_filtering_every_work(index):
+    refiltered = prep_articles.filter_keywords_indexed(index, config=CONFIG, verbose=False)
+    assert set(refiltered["id"]) == expected_ids(WORKS + UPDATES) == {"W2", "W3", "W5", "W6", "W7", "W8"}
+
+    refiltered = prep_articles.filter_keywords_indexed(index, config=CONFIG, exclude_ids={"W2", "W5"},
+                                                       verbose=False)
+    assert set(refiltered["id"]) == {"W3", "W6", "W7", "W8"}